@@ -1,15 +1,23 @@
-
-
 # annotator.py
 """
 Module de détection et annotation des références juridiques.
 Exporte :
  - PATTERNS : liste de patterns (type, regex, normalizer)
- - annotate_html(html) -> (annotated_html, list_of_refs)
+ - annotate_html(html, engine=...) -> (annotated_html, list_of_refs)
+ - TRIGGERS : mots-clés déclencheurs de chaque pattern
+ - ENGINES / DEFAULT_ENGINE : moteurs de recherche disponibles
+ - MODES / DEFAULT_MODE : HTML brut ou nœuds texte seulement
+ - PATTERNS_VERSION : empreinte du jeu de patterns (invalide les index persistés)
+ - ref_href(type, normalized) : ancre d'une référence
+ - StreamAnnotator : annotation d'un document reçu par morceaux (mode "raw"),
+   mémoire bornée par la fenêtre d'analyse
 """
 
 import re
-from typing import List, Dict, Any, Tuple
+import hashlib
+from time import perf_counter
+from bisect import bisect_right
+from typing import List, Dict, Any, Tuple, Optional
 from html import escape
 
 # Mois français (gère variantes OCR)
@@ -21,6 +29,14 @@ MOIS = (
 # Patterns de base
 DATE = rf"(?:1er|[0-3]?\d)\s+(?:{MOIS})\s+\d{{4}}"
 NUM = r"(?:n[°ºo]\s*)?\d{{2,4}}(?:[-/.]\d+)*(?:/[A-Z]{{1,3}})?"
+# Blancs repliés par les normaliseurs
+_WS_RE = re.compile(r"\s+")
+# Longueur maximale des parties libres (intitulé d'une loi, nom d'un
+# ministère…). Sans borne, chaque tentative peut parcourir tout un texte OCR
+# sans ponctuation : temps quadratique. Bornées, chaque tentative coûte au
+# plus O(FREE_MAX) et l'analyse reste linéaire. Les correspondances du
+# corpus font au plus ~160 caractères.
+FREE_MAX = 200
 
 # ============================================================================
 # PATTERNS V3 FINAL - COMPLETS ET ÉQUILIBRÉS
@@ -37,167 +53,706 @@ PATTERNS = [
     ("code",
      re.compile(r"\b[Ll]ivre\s+[IVX]+\s+du\s+[Cc]ode\s+(?:de\s+l['’]?environnement|du\s+[Tt]ravail)",
                 re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("code",
      re.compile(r"\barticle[s]?\s+[LRD]\.?\s*\d+(?:[-\.]\d+)*", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     # DIRECTIVE
     ("directive",
      re.compile(rf"\bdirective\s+\d{{4}}/\d{{1,4}}/(?:UE|CE|CEEA)(?:\s+du\s+{DATE})?", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).upper())),
+     lambda m: _WS_RE.sub(" ", m.group(0).upper())),
     ("directive",
      re.compile(r"\bdirective\s+européenne\s+n[°ºo]?\s*\d{4}/\d+", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     # LOI
     ("loi",
      re.compile(rf"\bloi\s+n[°ºo]\s*\d{{2,4}}[-–]\d+\s+du\s+{DATE}", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("loi",
      re.compile(rf"\bloi\s+du\s+{DATE}", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("loi",
-     re.compile(r"\b(?:la\s+)?loi\s+sur\s+(?:les\s+|l['’])[\w\s,'-]+?(?=\s+lui\s+sont|\s+sont\s+applicables|[,;.])",
+     re.compile(rf"\b(?:la\s+)?loi\s+sur\s+(?:les\s+|l['’])[\w\s,'-]{{1,{FREE_MAX}}}?(?=\s+lui\s+sont|\s+sont\s+applicables|[,;.])",
                 re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     # ARRETE MINISTERIEL
     ("arrete_ministeriel",
      re.compile(rf"\b(?:arrêté|arrete)\s+(?:ministériel|ministeriel)\s+(?:n[°ºo]\s*[\d/-]+\s+)?du\s+{DATE}",
                 re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("arrete_ministeriel",
-     re.compile(rf"\b(?:arrêté|arrete)\s+du\s+[Mm]inistre\s+(?:de\s+|d['’]|des\s+)[\w\s]+?\s+du\s+{DATE}",
+     re.compile(rf"\b(?:arrêté|arrete)\s+du\s+[Mm]inistre\s+(?:de\s+|d['’]|des\s+)[\w\s]{{1,{FREE_MAX}}}?\s+du\s+{DATE}",
                 re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("arrete_ministeriel",
      re.compile(r"\b(?:arrêtés?|arretes?)[-\s]types?\s+n[°ºo]\s*\d+(?:\s+et\s+\d+)*", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     # DECRET
     ("decret",
      re.compile(rf"\b(?:décret|decret)\s+n[°ºo]\s*\d{{2,4}}[-–\s]\d+\s+du\s+{DATE}", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("decret",
      re.compile(rf"\b(?:décret|decret)\s+du\s+{DATE}", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("decret",
      re.compile(rf"\barticle[s]?\s+\d+\s+du\s+(?:décret|decret)\s+n[°ºo]\s*\d+[-–\s]\d+", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     # CIRCULAIRE / INSTRUCTION
     ("circulaire",
      re.compile(rf"\bcirculaire\s+(?:ministérielle|ministerielle)\s+(?:n[°ºo]\s*[\d/-]+\s+)?du\s+{DATE}",
                 re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("circulaire",
      re.compile(rf"\bcirculaire\s+(?:n[°ºo]\s*[\d/-]+\s+)?du\s+{DATE}", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("circulaire",
      re.compile(rf"\binstruction\s+(?:ministérielle|ministerielle)\s+(?:n[°ºo]\s*[\d/-]+\s+)?du\s+{DATE}",
                 re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("circulaire",
-     re.compile(rf"\binstruction\s+du\s+[Mm]inistère\s+de\s+[\w\s'’]+?\s+du\s+{DATE}", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     re.compile(rf"\binstruction\s+du\s+[Mm]inistère\s+de\s+[\w\s'’]{{1,{FREE_MAX}}}?\s+du\s+{DATE}", re.IGNORECASE),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     # ARRETE PREFECTORAL
     ("arrete_prefectoral",
      re.compile(rf"\b(?:arrêté|arrete)\s+(?:préfectoral|prefectoral)\s+n[°ºo]\s*[\d/IC\-A-Z]+\s+du\s+{DATE}",
                 re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("arrete_prefectoral",
      re.compile(rf"\b(?:arrêté|arrete)\s+(?:préfectoral|prefectoral)\s+du\s+{DATE}", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("arrete_prefectoral",
      re.compile(r"\b(?:le\s+)?présent\s+(?:arrêté|arrete)\s+(?:préfectoral|prefectoral)?", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     # NORME
     ("norme",
      re.compile(r"\bnorme\s+française\s+[A-Z]+\s*\d+(?:[-\s]\d+)*", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("norme",
-     re.compile(r"\bnorme\s+(?:NF|ISO|EN)\s+[\w\s-]+", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     re.compile(rf"\bnorme\s+(?:NF|ISO|EN)\s+[\w\s-]{{1,{FREE_MAX}}}", re.IGNORECASE),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     # ARRETE GENERIQUE
     ("arrete",
      re.compile(rf"\b(?:arrêté|arrete)\s+du\s+{DATE}(?!\s+(?:préfectoral|prefectoral))", re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
     ("arrete",
      re.compile(r"\b(?:le\s+)?présent\s+(?:arrêté|arrete)(?!\s+(?:ministériel|ministeriel|préfectoral|prefectoral))",
                 re.IGNORECASE),
-     lambda m: re.sub(r"\s+", " ", m.group(0).lower())),
+     lambda m: _WS_RE.sub(" ", m.group(0).lower())),
 ]
 
+# Empreinte des patterns (type, regex, options) : change dès qu'un pattern est
+# modifié, ajouté ou réordonné. Les normaliseurs (lambdas) n'y entrent pas :
+# penser à modifier PATTERNS_REVISION quand seul un normaliseur change.
+PATTERNS_REVISION = 1
+PATTERNS_VERSION = hashlib.sha1(
+    "\n".join(
+        [str(PATTERNS_REVISION)]
+        + [f"{typ}\t{reg.flags}\t{reg.pattern}" for typ, reg, _ in PATTERNS]
+    ).encode("utf-8")
+).hexdigest()[:12]
+
+# ============================================================================
+# DÉCLENCHEURS (un tuple par entrée de PATTERNS, même ordre)
+# Mots par lesquels une correspondance du pattern peut COMMENCER : le moteur
+# "prefilter" n'essaie le pattern qu'aux positions de ces mots.
+# "le présent" : déclenché par "présent", la correspondance pouvant aussi
+# commencer au "le" optionnel qui précède (évite de relever chaque "le"/"la").
+# Aucun mot ne doit être le préfixe d'un autre ("arrêt" couvre arrêté/arrêtés).
+# ============================================================================
+
+_ARRETE = ("arrêt", "arret")
+_DECRET = ("décret", "decret")
+
+TRIGGERS = [
+    ("code",), ("code",), ("livre",), ("article",),                  # code
+    ("directive",), ("directive",),                                 # directive
+    ("loi",), ("loi",), ("la loi",),                                # loi
+    _ARRETE, _ARRETE, _ARRETE,                                      # arrêté ministériel
+    _DECRET, _DECRET, ("article",),                                 # décret
+    ("circulaire",), ("circulaire",), ("instruction",), ("instruction",),
+    _ARRETE, _ARRETE, ("le présent",),                              # arrêté préfectoral
+    ("norme",), ("norme",),                                         # norme
+    _ARRETE, ("le présent",),                                       # arrêté générique
+]
+assert len(TRIGGERS) == len(PATTERNS), "TRIGGERS doit suivre PATTERNS"
+
+# mot-clé (casefold) -> [(indice du pattern, mot optionnel qui le précède)]
+_KEYWORD_PATTERNS: Dict[str, List[Tuple[int, Optional[str]]]] = {}
+_LEAD_RE: Dict[str, Any] = {}
+for _i, _kws in enumerate(TRIGGERS):
+    for _kw in _kws:
+        _lead, _, _word = _kw.rpartition(" ")
+        if _lead:
+            _LEAD_RE[_lead] = re.compile(rf"\b{re.escape(_lead)}\s+", re.IGNORECASE)
+        _KEYWORD_PATTERNS.setdefault(_word.casefold(), []).append((_i, _lead or None))
+
+_KEYWORDS = sorted(_KEYWORD_PATTERNS, key=len, reverse=True)
+# Le lookahead sur la première lettre permet à sre de sauter vite les
+# positions inutiles (le \b initial seul lui fait perdre ce préfiltre)
+TRIGGER_RE = re.compile(
+    "(?=[" + re.escape("".join(sorted({kw[0] for kw in _KEYWORDS}))) + "])"
+    r"\b(?:" + "|".join(map(re.escape, _KEYWORDS)) + ")",
+    re.IGNORECASE,
+)
+
+# Moteur "combined" : une seule alternance de tous les patterns, dans l'ordre
+# de priorité de PATTERNS (groupes non capturants : des groupes nommés font
+# perdre à sre son préfiltre sur le premier caractère, ~10x plus lent)
+COMBINED = re.compile(
+    "|".join(f"(?:{reg.pattern})" for _, reg, _ in PATTERNS),
+    re.IGNORECASE,
+)
+
+# Expressions par indice (moteurs "multi" et "prefilter") ; horloge relue
+# tous les _BUDGET_CHECK essais quand un budget de temps est fixé
+_REGEXES = [reg for _, reg, _ in PATTERNS]
+_BUDGET_CHECK = 32
+
+ENGINES = ("multi", "combined", "prefilter")
+DEFAULT_ENGINE = "prefilter"
+
+# Modes d'analyse : "raw" parcourt le HTML brut (balises comprises),
+# "text" ne parcourt que les nœuds texte
+MODES = ("raw", "text")
+DEFAULT_MODE = "raw"
+
+# Balises "en ligne" : une référence peut les traverser. Toute autre balise
+# (ainsi que commentaires et contenu de script/style) est une barrière,
+# représentée par \x00 qu'aucun pattern n'accepte.
+INLINE_TAGS = frozenset((
+    "a", "abbr", "b", "bdi", "bdo", "cite", "code", "data", "dfn", "em", "font",
+    "i", "kbd", "mark", "q", "s", "samp", "small", "span", "strong", "sub",
+    "sup", "time", "u", "var",
+))
+_BARRIER = "\x00"
+
+# Corps de balise : les valeurs d'attribut entre guillemets peuvent contenir
+# ">". Jamais de \x00 : dans le texte, une balise en ligne non fermée ne doit
+# pas avaler la suite d'un autre bloc jusqu'au prochain ">".
+_TAG_BODY = r"""[^>"'\x00]*(?:"[^"\x00]*"[^>"'\x00]*|'[^'\x00]*'[^>"'\x00]*)*>"""
+
+
+def _nocase(word: str) -> str:
+    """'span' -> '[sS][pP][aA][nN]' (re.IGNORECASE ralentit nettement split)"""
+    return "".join(f"[{c.lower()}{c.upper()}]" for c in word)
+
+
+_INLINE_NAMES = "|".join(_nocase(t) for t in sorted(INLINE_TAGS, key=len, reverse=True))
+_SCRIPT, _STYLE = _nocase("script"), _nocase("style")
+
+# Balises de bloc les plus courantes dans les exports : testées sans lookahead
+_COMMON_BLOCKS = "td|tr|th|div|li|ul|ol|p|section|header|footer|table|thead|tbody|h[1-6]"
+
+# Une barrière et les blancs qui la suivent. Les balises ordinaires, de loin
+# les plus fréquentes, sont testées en premier.
+_BARRIER_TAG = (
+    rf"<(?:/?(?:{_COMMON_BLOCKS})(?=[\s/>]){_TAG_BODY}"
+    rf"|/?(?!(?:{_INLINE_NAMES}|{_SCRIPT}|{_STYLE})[\s/>])[A-Za-z]{_TAG_BODY}"
+    r"|!--.*?(?:-->|$)"
+    r"|[!?][^>]*>"
+    rf"|{_SCRIPT}\b[^>]*>.*?(?:</{_SCRIPT}\s*>|$)"
+    rf"|{_STYLE}\b[^>]*>.*?(?:</{_STYLE}\s*>|$))\s*"
+)
+# Une suite de barrières (</td><td>, </tr>\n<tr>…) est un seul séparateur :
+# split() alterne texte/séparateur, avec moitié moins de morceaux qu'une
+# balise par séparateur. Le "<" initial, hors de la répétition, garde à sre
+# son préfiltre sur le premier caractère.
+_BARRIER_RE = re.compile(rf"({_BARRIER_TAG}(?:{_BARRIER_TAG})*)", re.DOTALL)
+_INLINE_RE = re.compile(rf"</?(?:{_INLINE_NAMES})(?=[\s/>]){_TAG_BODY}")
+
 # -----------------------
 # Helpers
 # -----------------------
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+
 def _slugify(s: str) -> str:
     """Transforme une chaîne en slug URL-friendly"""
-    return re.sub(r"[^a-z0-9]+", "-", s.lower()).strip("-")
+    return _SLUG_RE.sub("-", s.lower()).strip("-")
 
 
-# -----------------------
-# Fonction principale
-# -----------------------
-def annotate_html(html: str) -> Tuple[str, List[Dict[str, Any]]]:
+def ref_href(typ: str, normalized: str) -> str:
+    """Ancre d'une référence : #ref:<type>:<slug de la forme normalisée>"""
+    return f"#ref:{typ}:{_slugify(normalized)}"
+
+
+def _make_ref(typ: str, normf, m) -> Dict[str, Any]:
+    """Construit le dict d'une référence retenue. Les moteurs gardent les
+    correspondances brutes en tuples : normalisation et dict ne sont faits
+    que pour celles qui survivent à la résolution des chevauchements."""
+    try:
+        normalized = normf(m)
+    except Exception:
+        normalized = m.group(0)
+    return {
+        "start": m.start(),
+        "end": m.end(),
+        "type": typ,
+        "text": m.group(0),
+        "normalized": normalized,
+    }
+
+
+def _scan_multi(s: str, stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
     """
-    Prend du HTML en entrée et renvoie (html_annoté, liste_références)
-    Chaque référence renvoyée contient : start, end, type, text, normalized, href
+    Moteur historique : un finditer par pattern, puis tri de toutes les
+    correspondances brutes pour résoudre les chevauchements.
     """
-    matches: List[Dict[str, Any]] = []
-    s = html
-
-    # Étape 1 : Collecte brute de toutes les correspondances
-    for typ, reg, normf in PATTERNS:
+    # Étape 1 : Collecte brute de toutes les correspondances :
+    # (début, -longueur, indice du pattern, match)
+    matches: List[Tuple[int, int, int, Any]] = []
+    for i, reg in enumerate(_REGEXES):
         for m in reg.finditer(s):
-            try:
-                normalized = normf(m)
-            except Exception:
-                normalized = m.group(0)
-            matches.append({
-                "start": m.start(),
-                "end": m.end(),
-                "type": typ,
-                "text": m.group(0),
-                "normalized": normalized,
-            })
+            p = m.start()
+            matches.append((p, p - m.end(), i, m))
 
     # Étape 2 : Résolution des chevauchements
-    # Tri : position croissante, puis longueur décroissante
-    matches.sort(key=lambda x: (x["start"], -(x["end"] - x["start"])))
+    # Tri : position croissante, puis longueur décroissante, puis ordre de PATTERNS
+    t0 = perf_counter() if stats is not None else 0.0
+    matches.sort(key=lambda x: x[:3])
+
+    filtered: List[Dict[str, Any]] = []
+    last_end = -1
+
+    for start, _, i, m in matches:
+        if start >= last_end:
+            typ, _, normf = PATTERNS[i]
+            filtered.append(_make_ref(typ, normf, m))
+            last_end = m.end()
+    if stats is not None:
+        stats["resolve_seconds"] = round(perf_counter() - t0, 6)
+    return filtered
+
 
+def _scan_combined(s: str, stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Moteur en une passe : COMBINED repère chaque position où au moins un
+    pattern correspond, puis les patterns sont rejoués (match ancré) à cette
+    seule position pour trouver la plus longue.
+
+    On reproduit exactement "un finditer par pattern + tri + glouton" :
+     - next_pos[i] émule la position de reprise du finditer du pattern i
+       (ses correspondances ne se chevauchent pas entre elles) ;
+     - à position égale, on garde la plus longue, puis le premier pattern.
+    La résolution des chevauchements se fait au fil de la recherche : pas de
+    temps de résolution séparé dans stats.
+    """
+    n_patterns = len(PATTERNS)
+    next_pos = [0] * n_patterns
     filtered: List[Dict[str, Any]] = []
     last_end = -1
+    pos = 0
+
+    while True:
+        cm = COMBINED.search(s, pos)
+        if cm is None:
+            break
+        p = cm.start()
+        best = None
+        for i in range(n_patterns):
+            if next_pos[i] > p:
+                continue
+            m = PATTERNS[i][1].match(s, p)
+            if m is None:
+                continue
+            next_pos[i] = m.end()
+            if best is None or m.end() > best[1].end():
+                best = (i, m)
+
+        if best is not None and p >= last_end:
+            typ, _, normf = PATTERNS[best[0]]
+            filtered.append(_make_ref(typ, normf, best[1]))
+            last_end = best[1].end()
+        pos = p + 1
+    return filtered
+
+
+def _lead_start(s: str, p: int, lead: str) -> Optional[int]:
+    """Début du mot optionnel `lead` suivi de blancs juste avant p, sinon None"""
+    i = p
+    while i > 0 and s[i - 1].isspace():
+        i -= 1
+    q = i - len(lead)
+    if i == p or q < 0:
+        return None
+    m = _LEAD_RE[lead].match(s, q)
+    return q if m is not None and m.end() == p else None
 
-    for m in matches:
-        if m["start"] >= last_end:
-            filtered.append(m)
-            last_end = m["end"]
 
-    # Étape 3 : Reconstruction HTML avec insertion des <a>
+def _scan_prefilter(s: str, stats: Optional[Dict[str, Any]] = None,
+                    budget: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Moteur à déclencheurs : un seul finditer de TRIGGER_RE relève les
+    positions des mots-clés, puis chaque pattern n'est essayé (match ancré)
+    qu'aux positions de ses propres déclencheurs. Un pattern dont aucun
+    déclencheur n'apparaît n'est pas exécuté du tout.
+
+    budget : secondes (étapes 1 et 2). Les essais se font dans l'ordre du
+    texte ; si le budget est dépassé, l'analyse s'arrête à la position
+    atteinte (stats["partial"], stats["cutoff"]) et les références renvoyées
+    sont exactement celles d'une analyse complète qui commencent avant elle.
+    """
+    deadline = perf_counter() + budget if budget is not None else None
+    cutoff = None
+
+    # Étape 1 : (position, pattern) candidats
+    candidates: List[Tuple[int, int]] = []
+    n_hits = 0
+    prev_end = 0
+    for km in TRIGGER_RE.finditer(s):
+        if deadline is not None and not n_hits % _BUDGET_CHECK and perf_counter() > deadline:
+            # le mot optionnel d'un déclencheur non relevé ("le" de "le
+            # présent") peut précéder km.start(), jamais la fin du précédent
+            cutoff = prev_end
+            break
+        n_hits += 1
+        prev_end = km.end()
+        p = km.start()
+        for i, lead in _KEYWORD_PATTERNS.get(km.group(0).casefold(), ()):
+            if lead is not None:
+                q = _lead_start(s, p, lead)
+                if q is not None:
+                    candidates.append((q, i))
+            candidates.append((p, i))
+    # déjà presque triés (un seul finditer) : seul un mot optionnel ("le" de
+    # "le présent") peut précéder la position de son déclencheur
+    candidates.sort()
+
+    # Étape 2 : essais dans l'ordre du texte, en émulant le finditer de
+    # chaque pattern (next_pos : position de reprise)
+    next_pos = [0] * len(PATTERNS)
+    raw = []
+    n_tries = 0
+    for p, i in candidates:
+        if p < next_pos[i]:
+            continue
+        if deadline is not None and not n_tries % _BUDGET_CHECK and perf_counter() > deadline:
+            cutoff = p
+            break
+        n_tries += 1
+        m = _REGEXES[i].match(s, p)
+        if m is not None:
+            raw.append((p, p - m.end(), i, m))
+            next_pos[i] = m.end()
+    if cutoff is not None:
+        # position d'arrêt : tous ses patterns n'ont pas été essayés
+        raw = [r for r in raw if r[0] < cutoff]
+
+    # Étape 3 : même résolution des chevauchements que le moteur "multi"
+    t0 = perf_counter() if stats is not None else 0.0
+    raw.sort(key=lambda x: x[:3])
+    filtered: List[Dict[str, Any]] = []
+    last_end = -1
+    for start, _, i, m in raw:
+        if start >= last_end:
+            typ, _, normf = PATTERNS[i]
+            filtered.append(_make_ref(typ, normf, m))
+            last_end = m.end()
+
+    if stats is not None:
+        run = len({i for _, i in candidates})
+        stats.update({
+            "patterns": len(PATTERNS),
+            "patterns_run": run,
+            "patterns_skipped": len(PATTERNS) - run,
+            "trigger_hits": n_hits,
+            "match_attempts": n_tries,
+            "resolve_seconds": round(perf_counter() - t0, 6),
+        })
+        if cutoff is not None:
+            stats.update({"partial": True, "cutoff": cutoff})
+    return filtered
+
+
+def _anchor(m: Dict[str, Any], text: str) -> str:
+    """Balise <a> d'une référence autour d'un texte déjà échappé"""
+    return (
+        f'<a href="{m["href"]}" data-ref-type="{m["type"]}" '
+        f'data-ref-normalized="{escape(m["normalized"])}">{text}</a>'
+    )
+
+
+def _render(s: str, filtered: List[Dict[str, Any]]) -> str:
+    """Reconstruit le HTML en insérant un <a> par référence (ajoute href)"""
     out_parts: List[str] = []
     cur = 0
 
     for m in filtered:
         out_parts.append(s[cur:m["start"]])
-
-        href = f"#ref:{m['type']}:{_slugify(m['normalized'])}"
-        a = (
-            '<a href="{href}" data-ref-type="{typ}" '
-            'data-ref-normalized="{norm}">{text}</a>'
-        ).format(
-            href=href,
-            typ=m["type"],
-            norm=escape(m["normalized"]),
-            text=escape(m["text"]),
-        )
-        out_parts.append(a)
+        m["href"] = ref_href(m["type"], m["normalized"])
+        out_parts.append(_anchor(m, escape(m["text"])))
         cur = m["end"]
 
-        m["href"] = href
-
     out_parts.append(s[cur:])
+    return "".join(out_parts)
+
+
+class _TextView:
+    """
+    Texte d'un document HTML, découpé une fois par _BARRIER_RE.
+
+    Le texte est la jonction par \x00 des blocs situés entre deux suites de
+    barrières, balises en ligne retirées. Les blancs qui suivent une barrière
+    (indentation entre balises de bloc) sont absorbés par le découpage :
+    aucune référence ne peut commencer par un blanc. Les positions dans le
+    source ne sont calculées que pour les blocs où une référence est trouvée,
+    en avançant un curseur (les références arrivent dans l'ordre).
+    """
+
+    __slots__ = ("text", "_parts", "_k", "_t", "_s", "_seg_k", "_seg")
+
+    def __init__(self, html: str):
+        if _BARRIER in html:
+            # Même longueur : les positions restent valables
+            html = html.replace(_BARRIER, "\x01")
+        # blocs aux indices pairs, séparateurs aux indices impairs
+        self._parts = _BARRIER_RE.split(html)
+        text = _BARRIER.join(self._parts[0::2])
+        self.text = _INLINE_RE.sub("", text) if "<" in text else text
+        # Curseur : bloc _k, qui commence en _t dans le texte et en _s dans le source
+        self._k = self._t = self._s = 0
+        self._seg_k, self._seg = -1, ([], [])
+
+    def _locate(self, t: int) -> Tuple[int, int, int]:
+        """(bloc, début texte, début source) du bloc contenant la position t"""
+        if t < self._t:
+            self._k = self._t = self._s = 0
+        k = self._k + self.text.count(_BARRIER, self._t, t)
+        if k != self._k:
+            self._s += sum(map(len, self._parts[2 * self._k:2 * k]))
+            self._t = self.text.rfind(_BARRIER, 0, t) + 1
+            self._k = k
+        return self._k, self._t, self._s
+
+    def _segments(self, k: int, t: int) -> Tuple[List[int], List[int]]:
+        """Morceaux de texte du bloc k (qui commence en t) : débuts texte, débuts dans le bloc"""
+        if self._seg_k != k:
+            starts, offsets, cur = [], [], 0
+            for tag in _INLINE_RE.finditer(self._parts[2 * k]):
+                starts.append(t)
+                offsets.append(cur)
+                t += tag.start() - cur
+                cur = tag.end()
+            starts.append(t)
+            offsets.append(cur)
+            self._seg_k, self._seg = k, (starts, offsets)
+        return self._seg
+
+    def pieces(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """Intervalles du source couvrant le texte [start, end) (sans \x00)"""
+        k, t, s = self._locate(start)
+        if "<" not in self._parts[2 * k]:
+            return [(start - t + s, end - t + s)]
+        # Bloc avec balises en ligne : un morceau par segment de texte traversé
+        starts, offsets = self._segments(k, t)
+        out = []
+        j = bisect_right(starts, start) - 1
+        while j < len(starts) and starts[j] < end:
+            seg_end = starts[j + 1] if j + 1 < len(starts) else end
+            lo, hi = max(start, starts[j]), min(end, seg_end)
+            if lo < hi:
+                base = s + offsets[j] - starts[j]
+                out.append((lo + base, hi + base))
+            j += 1
+        return out
+
+
+def _render_text(html: str, filtered: List[Dict[str, Any]], view: _TextView) -> str:
+    """
+    Variante de _render pour le mode "text" : les positions des références
+    (dans le texte) sont ramenées dans le source, et une référence qui
+    traverse des balises en ligne reçoit un <a> par morceau de texte, pour
+    ne jamais couper ni englober de balise.
+    """
+    out_parts: List[str] = []
+    cur = 0
+
+    for m in filtered:
+        m["href"] = ref_href(m["type"], m["normalized"])
+        pieces = view.pieces(m["start"], m["end"])
+        for lo, hi in pieces:
+            out_parts.append(html[cur:lo])
+            # Le texte source est déjà du HTML : pas de ré-échappement
+            out_parts.append(_anchor(m, html[lo:hi]))
+            cur = hi
+        m["start"], m["end"] = pieces[0][0], pieces[-1][1]
+
+    out_parts.append(html[cur:])
+    return "".join(out_parts)
+
 
-    annotated_html = "".join(out_parts)
+_SCANNERS = {
+    "multi": _scan_multi,
+    "combined": _scan_combined,
+    "prefilter": _scan_prefilter,
+}
+
+
+# -----------------------
+# Fonction principale
+# -----------------------
+def annotate_html(
+    html: str,
+    engine: str = DEFAULT_ENGINE,
+    stats: Optional[Dict[str, Any]] = None,
+    mode: str = DEFAULT_MODE,
+    budget: Optional[float] = None,
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Prend du HTML en entrée et renvoie (html_annoté, liste_références)
+    Chaque référence renvoyée contient : start, end, type, text, normalized, href
+
+    engine : "prefilter" (patterns lancés seulement sur leurs mots-clés),
+    "combined" (une seule passe sur le document) ou "multi" (un finditer par
+    pattern, implémentation de référence). Tous produisent exactement les
+    mêmes références.
+    stats : dict optionnel rempli avec le nombre de patterns exécutés/sautés
+    et le temps de chaque étape (scan_seconds : recherche, dont
+    resolve_seconds : résolution des chevauchements ; render_seconds :
+    reconstruction du HTML).
+    mode : "raw" (HTML brut, balises comprises) ou "text" (nœuds texte
+    seulement ; les <a> ne sont insérés que dans le texte et une référence
+    peut traverser des balises en ligne comme <b> ou <time>). Dans les deux
+    modes, start/end sont des positions dans le HTML source.
+    budget : temps maximal de recherche en secondes (moteur "prefilter"
+    seulement ; la résolution et la reconstruction, linéaires, s'y
+    ajoutent). S'il est dépassé, le résultat est partiel : les références
+    situées avant la position atteinte, comme dans une analyse complète, et
+    stats["partial"] = True, stats["cutoff"] = position d'arrêt dans le
+    texte analysé (passer stats pour le savoir).
+    """
+    try:
+        scan = _SCANNERS[engine]
+    except KeyError:
+        raise ValueError(f"Moteur inconnu: {engine!r} (attendu: {', '.join(ENGINES)})")
+    if mode not in MODES:
+        raise ValueError(f"Mode inconnu: {mode!r} (attendu: {', '.join(MODES)})")
+    if budget is not None and engine != "prefilter":
+        raise ValueError("Budget de temps : moteur \"prefilter\" seulement")
+
+    t0 = perf_counter() if stats is not None else 0.0
+    view = _TextView(html) if mode == "text" else None
+    s = view.text if view is not None else html
+
+    if engine == "prefilter":
+        filtered = scan(s, stats, budget)
+    else:
+        filtered = scan(s, stats)
+    if stats is not None and engine != "prefilter":
+        stats.update({
+            "patterns": len(PATTERNS),
+            "patterns_run": len(PATTERNS),
+            "patterns_skipped": 0,
+        })
+    if stats is not None:
+        stats["bytes_scanned"] = len(s)
+        t1 = perf_counter()
+        stats["scan_seconds"] = round(t1 - t0, 6)
+
+    if view is not None:
+        annotated_html = _render_text(html, filtered, view)
+    else:
+        annotated_html = _render(html, filtered)
+    if stats is not None:
+        stats["render_seconds"] = round(perf_counter() - t1, 6)
     return annotated_html, filtered
 
 
+# -----------------------
+# Annotation en flux
+# -----------------------
+# Caractères qu'aucun pattern ne consomme ni ne franchit (lookaheads
+# compris) : aucune référence ne traverse une coupure faite juste avant l'un
+# d'eux, et aucune ne commence par l'un d'eux. À revoir si un pattern vient
+# à accepter l'un de ces caractères.
+_CUT_CHARS = '<"():;!?«»'
+_STREAM_STATS = ("bytes_scanned", "trigger_hits", "match_attempts",
+                 "scan_seconds", "resolve_seconds", "render_seconds")
+
+
+class StreamAnnotator:
+    """
+    Annotation en mode "raw" d'un document reçu par morceaux (feed(), puis
+    close()) : chaque appel renvoie les (html annoté, références) des
+    portions terminées, dans l'ordre ; leur concaténation est le résultat
+    d'annotate_html sur le document entier, positions comprises.
+
+    Dès que `window` caractères sont en attente, la portion qui précède le
+    dernier caractère de _CUT_CHARS ("<" de la balise suivante, en pratique)
+    est analysée et émise : une référence ne pouvant traverser ce caractère,
+    elle est trouvée une fois et une seule, exactement comme dans le document
+    entier. Sans un tel caractère sur `max_window` caractères (texte brut
+    sans ponctuation), la coupure est forcée sur un blanc, avec
+    `overlap` caractères de recouvrement : les références qui commencent
+    avant la coupure sont émises, celles d'après sont cherchées dans la
+    portion suivante ; seule une référence plus longue que le recouvrement
+    pourrait alors différer (stats["forced_cuts"]).
+
+    La mémoire utilisée ne dépend que de `max_window`, pas de la taille du
+    document.
+    """
+
+    def __init__(self, engine: str = DEFAULT_ENGINE, window: int = 256 * 1024,
+                 max_window: int = 4 * 1024 * 1024, overlap: int = 4096,
+                 stats: Optional[Dict[str, Any]] = None):
+        if engine not in _SCANNERS:
+            raise ValueError(f"Moteur inconnu: {engine!r} (attendu: {', '.join(ENGINES)})")
+        if not 0 < overlap < window <= max_window:
+            raise ValueError("Fenêtre invalide : 0 < overlap < window <= max_window attendu")
+        self._scan = _SCANNERS[engine]
+        self.window, self.max_window, self.overlap = window, max_window, overlap
+        self.stats = stats if stats is not None else {}
+        self.stats.update({k: 0 for k in _STREAM_STATS + ("windows", "forced_cuts")})
+        self._buf = ""
+        self._base = 0  # position de _buf[0] dans le document
+
+    def feed(self, text: str) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        self._buf += text
+        out = []
+        while len(self._buf) >= self.window:
+            c = max(self._buf.rfind(ch, 1) for ch in _CUT_CHARS)
+            if c > 0:
+                # le caractère de coupure est lu (lookaheads), pas émis
+                out.append(self._emit(c + 1, c))
+            elif len(self._buf) >= self.max_window:
+                limit = len(self._buf) - self.overlap
+                c = max(self._buf.rfind(ch, 1, limit) for ch in " \t\r\n")
+                self.stats["forced_cuts"] += 1
+                out.append(self._emit(len(self._buf), c if c > 0 else limit))
+            else:
+                break
+        return out
+
+    def close(self) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """Portion restante (fin du document)"""
+        if not self._buf:
+            return []
+        return [self._emit(len(self._buf), len(self._buf))]
+
+    def _emit(self, scan_end: int, cut: int) -> Tuple[str, List[Dict[str, Any]]]:
+        st: Dict[str, Any] = {}
+        t0 = perf_counter()
+        refs = [r for r in self._scan(self._buf[:scan_end], st) if r["start"] < cut]
+        t1 = perf_counter()
+        end = max(cut, refs[-1]["end"]) if refs else cut
+        html = _render(self._buf[:end], refs)
+        st.update({
+            "bytes_scanned": scan_end,
+            "scan_seconds": t1 - t0,
+            "render_seconds": perf_counter() - t1,
+        })
+        for k in _STREAM_STATS:
+            self.stats[k] = round(self.stats[k] + st.get(k, 0), 6)
+        self.stats["windows"] += 1
+
+        for r in refs:
+            r["start"] += self._base
+            r["end"] += self._base
+        self._buf = self._buf[end:]
+        self._base += end
+        return html, refs
+
+
 # Si besoin : démonstration rapide
 if __name__ == "__main__":
     example = "<p>Vu le décret n° 77-1133 du 21 septembre 1977 et la loi du 12 janvier 2010.</p>"
@@ -1,22 +1,51 @@
 # ===================== IMPORTS =====================
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
-from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Tuple, AsyncIterator
 from pathlib import Path
-import io, json, zipfile, re, logging
+from functools import partial
+from contextlib import asynccontextmanager
+from bisect import bisect_right
+from collections import Counter
+from time import perf_counter
+import codecs, json, re, logging, os, sqlite3, threading
 
-from annotator import annotate_html, PATTERNS
+from annotator import annotate_html, StreamAnnotator, PATTERNS, PATTERNS_VERSION, MODES, DEFAULT_MODE
+from parallel import default_workers
+from manifest import Manifest, default_manifest_path
+from store import RefStore
+from citations import CitationGraph, folder_of
+from snapshot import Corpora, IndexSnapshot, corpus_name_ok
+from mapped import MappedIndex, file_key, write_index
+from zipstream import ZipReader, ZipWriter, html_entry
+from pipeline import Document, IndexSink, Pipeline, ZipSink, index_entries
+from refsjson import REFS_FORMATS, DEFAULT_REFS_FORMAT, dump_refs
+from metrics import Registry, MetricsMiddleware, STAGE_BUCKETS, trace_stage
+from jobs import Job, JobManager, QueueFull, DONE
+from compact import CompactIndex
+from cache import ResultCache, content_key
+from offload import Offloader, Overloaded, SizeLimit, annotation_body
+from concurrent.futures.process import BrokenProcessPool
+from dates import doc_date, parse_bound
 
 # ===================== LOGGING =====================
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("juridic-annotator")
 
 # ===================== INITIALISATION =====================
-app = FastAPI(title="API Références juridiques", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # pool de processus d'annotation prêt avant la première requête
+    ANNOTATOR.start()
+    yield
+    ANNOTATOR.close()
+
+app = FastAPI(title="API Références juridiques", version="1.0.0", lifespan=lifespan)
 
 # Autorisation CORS
 app.add_middleware(
@@ -26,10 +55,65 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ===================== MÉTRIQUES =====================
+# Exposées par /metrics (format texte Prometheus)
+METRICS = Registry()
+HTTP_LATENCY = METRICS.histogram(
+    "refs_http_request_duration_seconds", "Durée des requêtes HTTP, par route", ("method", "route", "status"))
+STAGE_SECONDS = METRICS.histogram(
+    "refs_stage_seconds",
+    "Durée par document de chaque étape : read (lecture du fichier), scan (recherche, "
+    "résolution comprise), resolve (résolution des chevauchements), render (reconstruction du HTML)",
+    ("stage",), STAGE_BUCKETS)
+DOCUMENTS = METRICS.counter("refs_documents_annotated_total", "Documents annotés", ("mode",))
+SCANNED_CHARS = METRICS.counter("refs_scanned_chars_total", "Caractères parcourus par l'annotateur", ("mode",))
+REFERENCES = METRICS.counter("refs_references_total", "Références trouvées", ("type",))
+INDEX_REFS = METRICS.gauge("refs_index_references", "Références de l'index en mémoire", ("corpus",))
+INDEX_FILES = METRICS.gauge("refs_index_files", "Documents de l'index en mémoire (ayant au moins une référence)",
+                            ("corpus",))
+INDEX_BUILD = METRICS.gauge(
+    "refs_index_build_seconds",
+    "Durée de la dernière construction d'index : annotate, manifest, store, load, total", ("stage",))
+INDEX_BUILDS = METRICS.counter("refs_index_builds_total", "Constructions d'index terminées")
+ZIP_SECONDS = METRICS.counter("refs_zip_compress_seconds_total", "Temps passé à compresser les archives ZIP")
+ZIP_BYTES = METRICS.counter("refs_zip_bytes_total", "Octets d'archives ZIP produits")
+PARTIAL = METRICS.counter("refs_documents_partial_total", "Documents dont l'analyse a dépassé le budget de temps", ("mode",))
+ANNOTATE_POOL = METRICS.gauge(
+    "refs_annotate_pool_requests", "Annotations confiées au pool de processus : running, queued", ("state",))
+ANNOTATE_REJECTED = METRICS.counter(
+    "refs_annotate_rejected_total", "Annotations refusées : too_large (413), overloaded, crashed (503)", ("reason",))
+
+# Latence par route ; en-tête X-Trace : détail des étapes dans Server-Timing
+app.add_middleware(MetricsMiddleware, latency=HTTP_LATENCY)
+
+_STAGES = ("read", "scan", "resolve", "render")
+
+def _observe(stats: Dict[str, Any], types: Iterable[str], mode: str, source: str = "document"):
+    """Comptabilise un document annoté (stats rempli par annotate_html)"""
+    if stats.get("partial"):
+        PARTIAL.inc(mode=mode)
+        logger.warning(f"⚠️ Analyse partielle, budget de {DOC_BUDGET} s dépassé "
+                       f"(arrêt à la position {stats['cutoff']}) : {source}")
+    for stage in _STAGES:
+        seconds = stats.get(f"{stage}_seconds")
+        if seconds is not None:
+            STAGE_SECONDS.observe(seconds, stage=stage)
+            trace_stage(stage, seconds)
+    DOCUMENTS.inc(mode=mode)
+    SCANNED_CHARS.inc(stats.get("bytes_scanned", 0), mode=mode)
+    for typ, n in Counter(types).items():
+        REFERENCES.inc(n, type=typ)
+
 # CORRECTION ICI : Chemin absolu basé sur la position du fichier api.py
 BASE_DIR = Path(__file__).resolve().parent
 TEMPLATES_DIR = BASE_DIR / "templates"
 STATIC_DIR = BASE_DIR / "static"
+# Index persistant (SQLite), rechargé à la demande après un redémarrage
+STORE_PATH = Path(os.environ.get("REFS_INDEX_DB", str(BASE_DIR / "index.sqlite")))
+# Index binaire projeté en mémoire, partagé par les workers (désactivé si vide)
+MMAP_PATH = Path(os.environ["REFS_INDEX_MMAP"]) if os.environ.get("REFS_INDEX_MMAP") else None
+# Archives produites par les tâches de fond
+JOBS_DIR = Path(os.environ.get("REFS_JOBS_DIR", str(BASE_DIR / "jobs")))
 
 # Vérifier que templates existe
 if not TEMPLATES_DIR.exists():
@@ -54,9 +138,16 @@ class AnnotateIn(BaseModel):
 class AnnotateOut(BaseModel):
     html: str
     references: List[Dict[str, Any]]
+    stats: Optional[Dict[str, Any]] = None
 
 class DirIn(BaseModel):
     path: str
+    corpus: str = "default"  # /index-dir : index nommé à construire
+    mode: str = DEFAULT_MODE
+    workers: int = 1  # > 1 : pool de processus (plafonné au nombre de cœurs)
+    incremental: bool = False  # /index-dir : ne réannoter que les fichiers nouveaux ou modifiés
+    refs_format: str = DEFAULT_REFS_FORMAT  # ZIP : "json" (indenté) ou "compact" (colonnes)
+    zip: bool = False  # /jobs/index-dir : produire aussi l'archive annotée, dans la même passe
 
 # ===================== ENDPOINTS SIMPLES =====================
 @app.get("/health")
@@ -69,99 +160,521 @@ def patterns():
     """Retourne tous les types de références supportés"""
     return {"supported": sorted(list({p[0] for p in PATTERNS}))}
 
-@app.post("/annotate", response_model=AnnotateOut)
-def annotate(payload: AnnotateIn):
-    """Annoter un HTML envoyé en body"""
-    annotated, refs = annotate_html(payload.html)
-    return {"html": annotated, "references": refs}
+def _check_mode(mode: str):
+    if mode not in MODES:
+        raise HTTPException(400, f"Mode inconnu: {mode} (attendu: {', '.join(MODES)})")
+
+def _check_refs_format(fmt: str):
+    if fmt not in REFS_FORMATS:
+        raise HTTPException(400, f"Format inconnu: {fmt} (attendu: {', '.join(REFS_FORMATS)})")
+
+# Temps maximal de recherche par document (secondes, 0 : sans limite) ; au-delà
+# le résultat est partiel et marqué "partial": true
+DOC_BUDGET = float(os.environ.get("REFS_DOC_BUDGET", "10")) or None
+
+# Cache des réponses de /annotate et /annotate-file (LRU, taille en octets)
+CACHE = ResultCache(int(os.environ.get("REFS_CACHE_BYTES", str(64 * 1024 * 1024))))
+
+def _etag_match(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# Annotation interactive : un document d'au moins REFS_ANNOTATE_INLINE_BYTES
+# octets est annoté dans un pool de REFS_ANNOTATE_WORKERS processus (0 : tout
+# dans le pool de threads), REFS_ANNOTATE_QUEUE au plus attendant un processus
+# libre (au-delà : 503) ; corps de requête limité à REFS_ANNOTATE_MAX_BYTES
+ANNOTATE_MAX_BYTES = int(os.environ.get("REFS_ANNOTATE_MAX_BYTES", str(16 * 1024 * 1024)))
+ANNOTATE_INLINE_BYTES = int(os.environ.get("REFS_ANNOTATE_INLINE_BYTES", str(32 * 1024)))
+ANNOTATOR = Offloader(
+    workers=int(os.environ.get("REFS_ANNOTATE_WORKERS", str(default_workers()))),
+    max_queued=int(os.environ.get("REFS_ANNOTATE_QUEUE", "16")),
+)
+app.add_middleware(SizeLimit, rejected=ANNOTATE_REJECTED,
+                   limits={"/annotate": ANNOTATE_MAX_BYTES, "/annotate-file": ANNOTATE_MAX_BYTES})
+
+def _cache_result(key: str, mode: str, body: bytes, st: Dict[str, Any], types: List[str]) -> Tuple[bytes, bool]:
+    _observe(st, types, mode)
+    if st.get("partial"):
+        # dépend de la charge du moment : ni mis en cache, ni ETag
+        return body, False
+    CACHE.put(key, body)
+    return body, True
 
-@app.post("/annotate-file", response_model=AnnotateOut)
-async def annotate_file(file: UploadFile = File(...)):
+def _annotation_body(key: str, html: str, stats: bool, mode: str) -> Tuple[bytes, bool]:
+    """(corps JSON {"html", "references"[, "stats"][, "partial"]}, complet ?),
+    depuis le cache si possible"""
+    body = CACHE.get(key)
+    if body is not None:
+        return body, True
+    return _cache_result(key, mode, *annotation_body(html, mode, DOC_BUDGET, stats))
+
+async def _offloaded_body(key: str, html: str, stats: bool, mode: str) -> Tuple[bytes, bool]:
+    """Comme _annotation_body, l'annotation dans le pool de processus ;
+    503 si sa file d'attente est pleine"""
+    body = CACHE.get(key)
+    if body is not None:
+        return body, True
+    try:
+        result = await ANNOTATOR.run(annotation_body, html, mode, DOC_BUDGET, stats)
+    except Overloaded:
+        ANNOTATE_REJECTED.inc(reason="overloaded")
+        raise HTTPException(503, "Trop d'annotations en cours, réessayer plus tard",
+                            headers={"Retry-After": "1"})
+    except BrokenProcessPool:
+        ANNOTATE_REJECTED.inc(reason="crashed")
+        raise HTTPException(503, "Processus d'annotation interrompu, réessayer plus tard",
+                            headers={"Retry-After": "1"})
+    return _cache_result(key, mode, *result)
+
+async def _cached_annotate(request: Request, data: bytes, html: str, stats: bool, mode: str) -> Response:
+    """Réponse JSON d'annotation, servie depuis le cache si le même contenu
+    a déjà été annoté ; 304 si le client possède déjà cette version (ETag).
+    Un gros document est annoté dans le pool de processus, un petit sur place."""
+    if len(data) > ANNOTATE_MAX_BYTES:
+        # corps sans Content-Length : SizeLimit n'a pas pu le refuser d'emblée
+        ANNOTATE_REJECTED.inc(reason="too_large")
+        raise HTTPException(413, f"Document trop volumineux (> {ANNOTATE_MAX_BYTES} octets), voir /annotate-stream")
+    inline = len(data) < ANNOTATE_INLINE_BYTES or ANNOTATOR.workers <= 0
+    variant = "stats" if stats else ""
+    # hors de la boucle d'événements au-delà de quelques Ko (hashlib relâche le GIL)
+    key = content_key(data, mode, variant) if inline else await run_in_threadpool(content_key, data, mode, variant)
+    headers = {"ETag": f'"{key[:32]}"'}
+    if _etag_match(request.headers.get("if-none-match"), headers["ETag"]):
+        CACHE.note_not_modified()
+        return Response(status_code=304, headers=headers)
+    if inline:
+        body, complete = await run_in_threadpool(_annotation_body, key, html, stats, mode)
+    else:
+        body, complete = await _offloaded_body(key, html, stats, mode)
+    return Response(body, media_type="application/json", headers=headers if complete else None)
+
+@app.post("/annotate", response_model=AnnotateOut, response_model_exclude_none=True)
+async def annotate(payload: AnnotateIn, request: Request, stats: bool = False, mode: str = DEFAULT_MODE):
+    """Annoter un HTML envoyé en body (?stats=true : patterns exécutés/sautés,
+    ?mode=text : analyse des seuls nœuds texte)"""
+    _check_mode(mode)
+    return await _cached_annotate(request, payload.html.encode("utf-8"), payload.html, stats, mode)
+
+@app.post("/annotate-file", response_model=AnnotateOut, response_model_exclude_none=True)
+async def annotate_file(request: Request, file: UploadFile = File(...), stats: bool = False, mode: str = DEFAULT_MODE):
     """Annoter un fichier HTML uploadé"""
-    html = (await file.read()).decode("utf-8", errors="ignore")
-    annotated, refs = annotate_html(html)
-    return {"html": annotated, "references": refs}
+    _check_mode(mode)
+    data = await file.read()
+    return await _cached_annotate(request, data, data.decode("utf-8", errors="ignore"), stats, mode)
+
+# ==== Annotation en flux (gros documents) ====
+class _DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse qui laisse lire le corps de la requête pendant
+    l'envoi : Starlette y guette sinon la déconnexion du client en consommant
+    les messages entrants. Une déconnexion se voit alors à l'écriture."""
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+async def _annotation_stream(request: Request, stats: bool) -> AsyncIterator[bytes]:
+    """Lignes NDJSON {"html", "references"} au fil du corps reçu, puis
+    {"done": true, "references": n[, "stats"]}"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    annotator = StreamAnnotator()
+    types: Counter = Counter()
+
+    def lines(pieces) -> bytes:
+        out = []
+        for html, refs in pieces:
+            types.update(r["type"] for r in refs)
+            out.append(_dumps({"html": html, "references": refs}) + b"\n")
+        return b"".join(out)
+
+    async for chunk in request.stream():
+        if chunk:
+            body = await run_in_threadpool(lambda: lines(annotator.feed(decoder.decode(chunk))))
+            if body:
+                yield body
+    yield await run_in_threadpool(lambda: lines(annotator.feed(decoder.decode(b"", final=True))
+                                                + annotator.close()))
+    st = annotator.stats
+    _observe(st, types.elements(), "raw", "flux")
+    trailer: Dict[str, Any] = {"done": True, "references": sum(types.values())}
+    if stats:
+        trailer["stats"] = st
+    yield _dumps(trailer) + b"\n"
+
+@app.post("/annotate-stream")
+async def annotate_stream(request: Request, stats: bool = False):
+    """Annoter un gros document (corps brut, HTML en UTF-8) en flux : la
+    réponse NDJSON donne, portion par portion, le HTML annoté et ses
+    références (positions dans le document entier), puis une ligne finale
+    {"done": true, "references": n}. La mémoire ne dépend pas de la taille
+    du document. Mode "raw" seulement ; ni cache ni budget de temps."""
+    return _DuplexStreamingResponse(_annotation_stream(request, stats), media_type="application/x-ndjson")
+
+# ==== Annotation par lots (NDJSON) ====
+def _batch_line(doc_id: Any, doc: Any, refs_only: bool, stats: bool, mode: str) -> bytes:
+    """Une ligne de résultat : {"id", "html", "references"[, "stats"]},
+    sans "html" si refs_only, {"id", "error"} si le document est invalide"""
+    html = doc.get("html") if isinstance(doc, dict) else doc
+    if not isinstance(html, str):
+        return _dumps({"id": doc_id, "error": "document invalide (attendu : chaîne HTML ou objet avec html)"}) + b"\n"
+    if refs_only:
+        st = {}
+        _, refs = annotate_html(html, stats=st, mode=mode, budget=DOC_BUDGET)
+        _observe(st, (r["type"] for r in refs), mode, f"document {doc_id}")
+        out = {"id": doc_id, "references": refs}
+        if stats:
+            out["stats"] = st
+        if st.get("partial"):
+            out["partial"] = True
+        return _dumps(out) + b"\n"
+    key = content_key(html.encode("utf-8"), mode, "stats" if stats else "")
+    # {"id":…, + corps mis en cache sans son "{" initial
+    return b'{"id":' + _dumps(doc_id) + b"," + _annotation_body(key, html, stats, mode)[0][1:] + b"\n"
+
+def _batch_doc(n: int, doc: Any):
+    doc_id = doc.get("id", n) if isinstance(doc, dict) else n
+    return doc_id, doc
 
-# ==== Endpoint classification ====
-# Variables globales pour l'index
-INDEX_BUILT = False
-ITEMS: Dict[int, Dict[str, Any]] = {}
-TREE: Dict[str, list] = {}
-NEXT_ID = 1
+def _ndjson_docs(body: bytes):
+    """(id, document), un document par ligne, découpé au fur et à mesure"""
+    n = pos = 0
+    while pos < len(body):
+        end = body.find(b"\n", pos)
+        if end < 0:
+            end = len(body)
+        line = body[pos:end]
+        pos = end + 1
+        if line.strip():
+            yield _ndjson_doc(n, line)
+            n += 1
+
+def _ndjson_doc(n: int, line: bytes):
+    try:
+        return _batch_doc(n, json.loads(line))
+    except ValueError:
+        return n, None
+
+@app.post("/annotate-batch")
+async def annotate_batch(request: Request, refs_only: bool = False, stats: bool = False,
+                         mode: str = DEFAULT_MODE):
+    """Annote plusieurs documents en une requête. Corps : tableau JSON ou
+    NDJSON (Content-Type application/x-ndjson), chaque document étant une
+    chaîne HTML ou un objet {"id", "html"}. Réponse NDJSON : une ligne par
+    document, dans l'ordre, émise dès que le document est annoté
+    (?refs_only=true : références seulement, sans le HTML)."""
+    _check_mode(mode)
+    content_type = request.headers.get("content-type", "")
+    ndjson = "ndjson" in content_type or "jsonl" in content_type
+
+    # Corps lu avant de répondre : pendant l'envoi d'une StreamingResponse,
+    # Starlette consomme les messages entrants pour détecter la déconnexion
+    body = await request.body()
+    if ndjson:
+        docs = _ndjson_docs(body)
+    else:
+        # erreurs de format du tableau : 400 avant le début de la réponse
+        try:
+            array = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(400, f"JSON invalide: {e}")
+        if not isinstance(array, list):
+            raise HTTPException(400, "Un tableau JSON de documents est attendu")
+        docs = (_batch_doc(n, doc) for n, doc in enumerate(array))
+
+    async def lines():
+        for doc_id, doc in docs:
+            yield await run_in_threadpool(_batch_line, doc_id, doc, refs_only, stats, mode)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Métriques au format texte Prometheus : latence par route, documents,
+    caractères et références par type, temps par étape, taille et durée de
+    construction de l'index, compression des ZIP"""
+    ANNOTATE_POOL.set(ANNOTATOR.running, state="running")
+    ANNOTATE_POOL.set(ANNOTATOR.waiting, state="queued")
+    return Response(METRICS.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Compteurs du cache d'annotation : hits, misses, évictions, 304"""
+    return CACHE.stats()
+
+# ==== Index en mémoire ====
+# Un instantané immuable par corpus nommé : une reconstruction publie le
+# nouvel instantané d'un coup, les lectures en cours finissent sur l'ancien
+DEFAULT_CORPUS = "default"
+CORPORA = Corpora()
+# Index persistants (SQLite), un fichier par corpus
+_STORES: Dict[str, RefStore] = {}
+# Une seule construction d'index à la fois (endpoint synchrone ou tâche) ;
+# les lectures ne le prennent jamais
+_INDEX_LOCK = threading.Lock()
+# Chargement depuis SQLite ou le fichier projeté
+_LOAD_LOCK = threading.Lock()
+# Corpus -> identité du fichier projeté de l'instantané publié
+_MAPPED: Dict[str, Tuple[int, int, int]] = {}
+
+def _corpus(name: str) -> str:
+    if not corpus_name_ok(name):
+        raise HTTPException(400, f"Nom de corpus invalide: {name} (lettres, chiffres, - et _)")
+    return name
+
+def _corpus_path(base: Path, corpus: str) -> Path:
+    if corpus == DEFAULT_CORPUS:
+        return base
+    return base.with_name(f"{base.stem}-{corpus}{base.suffix}")
+
+def _store_path(corpus: str) -> Path:
+    return _corpus_path(STORE_PATH, corpus)
+
+def _store(corpus: str = DEFAULT_CORPUS) -> RefStore:
+    store = _STORES.get(corpus)
+    if store is None:
+        store = _STORES.setdefault(corpus, RefStore(_store_path(corpus)))
+    return store
+
+def _set_index(corpus: str, entries: Iterable[Dict[str, Any]], next_id: int,
+               meta: Optional[Dict[str, str]] = None, snippets: bool = False) -> IndexSnapshot:
+    """Construit un instantané (hors de toute lecture) puis le publie ;
+    snippets : extraits gardés en mémoire (sources absentes du disque).
+    Avec REFS_INDEX_MMAP, l'index est écrit dans le fichier partagé, que ce
+    worker projette comme les autres."""
+    items = CompactIndex(entries, snippets=snippets)
+    if MMAP_PATH is not None:
+        write_index(_corpus_path(MMAP_PATH, corpus), items, next_id, meta)
+        del items
+        with _LOAD_LOCK:
+            return _map_index(corpus)
+    return _publish(corpus, IndexSnapshot(items, next_id, meta))
+
+def _publish(corpus: str, snap: IndexSnapshot) -> IndexSnapshot:
+    CORPORA.publish(corpus, snap)
+    INDEX_REFS.set(len(snap.items), corpus=corpus)
+    INDEX_FILES.set(len(snap.items.files()), corpus=corpus)
+    return snap
+
+def _map_index(corpus: str) -> Optional[IndexSnapshot]:
+    """Projette le fichier d'index du corpus s'il a changé (sous _LOAD_LOCK)"""
+    path = _corpus_path(MMAP_PATH, corpus)
+    key = file_key(path)
+    if key is None or _MAPPED.get(corpus) == key:
+        return CORPORA.get(corpus)
+    try:
+        items = MappedIndex(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ Index projeté illisible ({path}) : {e}")
+        return CORPORA.get(corpus)
+    snap = _publish(corpus, IndexSnapshot(items, items.next_id, items.meta,
+                                          buckets=items.postings(), gen=items.generation))
+    _MAPPED[corpus] = key
+    return snap
+
+# préfixes de la clé (meta "key") des index persistés que l'API sait relire
+_STORE_WRITERS = ("api", "batch")
+
+def _load_index(corpus: str = DEFAULT_CORPUS) -> Optional[IndexSnapshot]:
+    """Instantané courant du corpus ; au premier appel après un redémarrage,
+    chargé depuis l'index persisté. None si aucun index n'a été construit.
+    Avec REFS_INDEX_MMAP, un fichier remplacé (par un autre worker ou par
+    batch.py) est projeté à nouveau : un stat() par requête."""
+    snap = CORPORA.get(corpus)
+    if MMAP_PATH is not None:
+        key = file_key(_corpus_path(MMAP_PATH, corpus))
+        if key is not None and _MAPPED.get(corpus) != key:
+            with _LOAD_LOCK:
+                snap = _map_index(corpus)
+    if snap is not None:
+        return snap
+    with _LOAD_LOCK:
+        snap = CORPORA.get(corpus)
+        if snap is not None or not _store_path(corpus).exists():
+            return snap
+        store = _store(corpus)
+        meta = store.meta()
+        # écrit par /index-dir, /index-zip ou batch.py --db ; sinon (base vide,
+        # ou recréée après un changement de schéma) : aucun index
+        if meta.get("key", "").split(":")[0] not in _STORE_WRITERS:
+            return None
+        snippets = meta.get("source", "").startswith("zip:")
+        return _publish(corpus, IndexSnapshot.from_entries(store.items(), store.max_id() + 1, meta, snippets))
+
+# ==== Vues paginées (/tree, /classification) ====
+# Sans limit ni cursor : réponse complète, comme auparavant. Avec : une page
+# {"items", "next_cursor", "total"} dont le coût ne dépend que de sa taille.
+_TREE_FIELDS = ("id", "text", "file", "date")
+_CLASSIFICATION_FIELDS = ("id", "file", "text", "date")
+_ITEM_FIELDS = ("id", "type", "text", "normalized", "file", "date", "snippet", "href")
+# champs disponibles sur demande (?fields=), absents de la réponse par défaut
+_EXTRA_FIELDS = ("date_iso", "doc_date")
+
+def _fields(fields: Optional[str], default: tuple) -> tuple:
+    """Projection ?fields=id,text (dans l'ordre de la vue)"""
+    if not fields:
+        return default
+    allowed = default + tuple(f for f in _EXTRA_FIELDS if f not in default)
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted.difference(allowed)
+    if unknown:
+        raise HTTPException(400, f"Champs inconnus: {', '.join(sorted(unknown))} (disponibles: {', '.join(allowed)})")
+    return tuple(f for f in allowed if f in wanted)
+
+def _cursor_start(cursor: Optional[str], snap: IndexSnapshot) -> int:
+    """Curseur "<génération>.<position>" ; refusé si l'index a été reconstruit"""
+    if not cursor:
+        return 0
+    gen, _, pos = cursor.partition(".")
+    if not (gen.isdigit() and pos.isdigit()):
+        raise HTTPException(400, "Curseur invalide")
+    if int(gen) != snap.gen:
+        raise HTTPException(409, "Index reconstruit depuis la page précédente : recommencer sans curseur")
+    return int(pos)
+
+def _next_cursor(end: int, total: int, snap: IndexSnapshot) -> Optional[str]:
+    return f"{snap.gen}.{end}" if end < total else None
+
+def _types_page(snap: IndexSnapshot, cursor: Optional[str], limit: Optional[int],
+                fields: tuple) -> Dict[str, Any]:
+    """Page de la liste de toutes les références, type par type ("type" ajouté à chaque entrée)"""
+    total = len(snap.items)
+    start = _cursor_start(cursor, snap)
+    end = min(start + (limit or 100), total)
+    page = []
+    types = list(snap.buckets)
+    k = max(0, bisect_right(snap.bucket_starts, start) - 1)
+    pos = start
+    while pos < end:
+        typ = types[k]
+        ids = snap.buckets[typ]
+        offset = pos - snap.bucket_starts[k]
+        take = ids[offset:offset + end - pos]
+        page.extend({"type": typ, **snap.items.project(i, fields)} for i in take)
+        pos += len(take)
+        k += 1
+    return {"items": page, "next_cursor": _next_cursor(end, total, snap), "total": total}
+
+def _index(corpus: str, message: str = "Index non construit. Appelle d'abord /index-dir.") -> IndexSnapshot:
+    """Instantané à utiliser pour toute la requête (400 si aucun index n'a
+    été construit ; un index construit sur un dossier vide est servi vide)"""
+    snap = _load_index(_corpus(corpus))
+    if snap is None:
+        raise HTTPException(400, message)
+    return snap
 
 @app.get("/classification")
-def classification():
-    if not INDEX_BUILT:
-        raise HTTPException(400, "Index non construit. Appelle d'abord /index-dir.")
-    
-    classification_dict = {}
-    for item in ITEMS.values():
-        type_text = item.get("type") or "Autres"
-        classification_dict.setdefault(type_text, []).append({
-            "id": item["id"],
-            "file": item["file"],
-            "text": item["text"],
-            "date": item["date"]
-        })
-    return classification_dict
+def classification(summary: bool = False, limit: Optional[int] = Query(None, ge=1, le=10000),
+                   cursor: Optional[str] = None, fields: Optional[str] = None,
+                   corpus: str = DEFAULT_CORPUS):
+    """Références par type. ?summary=true : nombre par type ; ?limit / ?cursor :
+    pagination ; ?fields=id,text : projection ; ?corpus= : index nommé"""
+    snap = _index(corpus)
+    if summary:
+        return {typ: len(ids) for typ, ids in snap.buckets.items()}
+    proj = _fields(fields, _CLASSIFICATION_FIELDS)
+    if limit is None and cursor is None:
+        return {typ: [snap.items.project(i, proj) for i in ids] for typ, ids in snap.buckets.items()}
+    return _types_page(snap, cursor, limit, proj)
 
 @app.get("/classification/{arrete_type}")
-def classification_items(arrete_type: str):
-    if not INDEX_BUILT:
-        raise HTTPException(400, "Index non construit.")
-    
-    items_list = [i for i in ITEMS.values() if i.get("type") == arrete_type]
-    return items_list
+def classification_items(arrete_type: str, summary: bool = False,
+                         limit: Optional[int] = Query(None, ge=1, le=10000),
+                         cursor: Optional[str] = None, fields: Optional[str] = None,
+                         corpus: str = DEFAULT_CORPUS):
+    """Références complètes d'un type (mêmes options que /classification)"""
+    snap = _index(corpus, "Index non construit.")
+    ids = snap.buckets.get(arrete_type, [])
+    if summary:
+        return {"type": arrete_type, "count": len(ids)}
+    proj = _fields(fields, _ITEM_FIELDS)
+    if limit is None and cursor is None:
+        return [snap.items.project(i, proj) for i in ids]
+    start = _cursor_start(cursor, snap)
+    end = min(start + (limit or 100), len(ids))
+    return {
+        "items": [snap.items.project(i, proj) for i in ids[start:end]],
+        "next_cursor": _next_cursor(end, len(ids), snap),
+        "total": len(ids),
+    }
 
 # ===================== INDEXATION =====================
-def _parse_date(text: str):
-    """Extrait une date depuis un texte"""
-    mois = ("janvier|février|fevrier|mars|avril|mai|juin|juillet|août|"
-            "aout|septembre|octobre|novembre|décembre|decembre")
-    date_re = re.compile(rf"(1er|[0-3]?\d)\s+({mois})\s+\d{{4}}", re.IGNORECASE)
-    m = date_re.search(text or "")
-    return m.group(0) if m else None
-
-def _build_index(input_dir: Path):
-    """Construit un index des références juridiques dans un dossier"""
-    global INDEX_BUILT, ITEMS, TREE, NEXT_ID
-    INDEX_BUILT, ITEMS, TREE, NEXT_ID = False, {}, {}, 1
-
-    html_files = [
-        p for p in input_dir.rglob("*.html")
-        if "__MACOSX" not in str(p) and not p.name.startswith("._")
-    ]
-
-    for f in html_files:
-        raw = f.read_text(encoding="utf-8", errors="ignore")
-        annotated, refs = annotate_html(raw)
-
-        for r in refs:
-            start, end = r["start"], r["end"]
-            snippet = raw[max(0, start-100):end+100].replace("\n", " ")
-
-            item = {
-                "id": NEXT_ID,
-                "type": r["type"],
-                "text": r["text"],
-                "normalized": r.get("normalized", r["text"]),
-                "file": str(f),
-                "date": _parse_date(r.get("text")) or _parse_date(r.get("normalized")),
-                "snippet": snippet,
-                "href": r.get("href", ""),
-            }
-
-            ITEMS[NEXT_ID] = item
-            TREE.setdefault(r["type"], []).append({
-                "id": NEXT_ID,
-                "text": r["text"],
-                "file": str(f),
-                "date": item["date"],
-            })
-
-            NEXT_ID += 1
-
-    INDEX_BUILT = True
+def _workers(requested: int) -> int:
+    return max(1, min(requested, default_workers()))
+
+def _observer(mode: str):
+    """on_document du pipeline : métriques et journal de chaque document"""
+    def observe(doc: Document):
+        _observe(doc.stats, (r["type"] for r in doc.refs), mode, str(doc.file))
+    return observe
+
+def _index_entries(raw: str, file: str, mode: str, budget: Optional[float],
+                   stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Entrées d'index (sans ID) d'un document ; file : son chemin"""
+    _, refs = annotate_html(raw, stats=stats, mode=mode, budget=budget)
+    return index_entries(raw, refs, file)
+
+def _build_index(input_dir: Path, mode: str = DEFAULT_MODE, workers: int = 1,
+                 incremental: bool = False, job: Optional[Job] = None,
+                 corpus: str = DEFAULT_CORPUS, sinks: Iterable[Any] = ()) -> Dict[str, int]:
+    """Construit l'index du corpus pour un dossier et le publie ; l'index
+    précédent sert les lectures jusque-là.
+    Le manifeste (<dossier>_index.json, <dossier>_index-<corpus>.json pour un
+    corpus nommé) est toujours réécrit ; en mode incrémental il est relu et
+    seuls les fichiers nouveaux ou modifiés sont annotés. Renvoie le nombre
+    de fichiers annotés / supprimés / inchangés.
+    job : progression par fichier ; une annulation laisse l'index précédent
+    intact (rien n'est remplacé avant la fin de l'annotation).
+    sinks : autres sorties du pipeline (archive…), servies par la même passe ;
+    tous les fichiers sont alors annotés, l'index ne reprend que les modifiés."""
+    suffix = "_index.json" if corpus == DEFAULT_CORPUS else f"_index-{corpus}.json"
+    manifest_path = default_manifest_path(input_dir, suffix)
+    key = f"api:{mode}"
+    manifest = Manifest.load(manifest_path, key) if incremental else Manifest(manifest_path, key)
+
+    timings = {}
+    t0 = perf_counter()
+    index = IndexSink(manifest)
+    Pipeline(input_dir, [index, *sinks], mode, workers, DOC_BUDGET,
+             on_document=_observer(mode), progress=job).run()
+    html_files, changed, deleted = index.files, index.changed, index.deleted
+    t1 = perf_counter()
+    timings["annotate"] = t1 - t0
+    try:
+        manifest.save()
+    except OSError as e:
+        logger.warning(f"⚠️ Manifeste non enregistré ({manifest_path}) : {e}")
+    t2 = perf_counter()
+    timings["manifest"] = t2 - t1
+
+    meta = {"source": str(input_dir), "key": key, "patterns": PATTERNS_VERSION}
+    try:
+        store = _store(corpus)
+        if incremental and store.meta() == meta:
+            store.update_files([str(f) for f in changed] + deleted, manifest.entries(changed), meta)
+        else:
+            store.replace(manifest.entries(html_files), meta)
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Index SQLite non enregistré ({_store_path(corpus)}) : {e}")
+    t3 = perf_counter()
+    timings["store"] = t3 - t2
+
+    _set_index(corpus, index.entries(), manifest.next_id, meta)
+    timings["load"] = perf_counter() - t3
+    timings["total"] = perf_counter() - t0
+    _record_build(timings)
+    return index.close()
+
+def _record_build(timings: Dict[str, float]):
+    for stage, seconds in timings.items():
+        INDEX_BUILD.set(round(seconds, 6), stage=stage)
+        if stage != "total":
+            trace_stage(f"index_{stage}", seconds)
+    INDEX_BUILDS.inc()
 
 @app.post("/index-dir")
 def index_dir(payload: DirIn):
@@ -169,69 +682,207 @@ def index_dir(payload: DirIn):
     p = Path(payload.path)
     if not p.exists() or not p.is_dir():
         raise HTTPException(404, f"Dossier introuvable: {p}")
-    _build_index(p)
-    total = sum(len(v) for v in TREE.values())
-    return {"ok": True, "types": list(TREE.keys()), "count": total}
+    _check_mode(payload.mode)
+    corpus = _corpus(payload.corpus)
+    with _INDEX_LOCK:
+        files = _build_index(p, mode=payload.mode, workers=_workers(payload.workers),
+                             incremental=payload.incremental, corpus=corpus)
+        snap = CORPORA.get(corpus)
+    return {"ok": True, "corpus": corpus, "types": list(snap.buckets.keys()), "count": len(snap.items),
+            "files": files}
 
 @app.get("/tree")
-def tree():
-    """Retourne l'arborescence par type de référence"""
-    if not INDEX_BUILT:
-        raise HTTPException(400, "Index non construit. Appelle d'abord /index-dir.")
-    return TREE
+def tree(summary: bool = False, limit: Optional[int] = Query(None, ge=1, le=10000),
+         cursor: Optional[str] = None, fields: Optional[str] = None, corpus: str = DEFAULT_CORPUS):
+    """Retourne l'arborescence par type de référence (mêmes options que /classification)"""
+    snap = _index(corpus)
+    if summary:
+        return {typ: len(ids) for typ, ids in snap.buckets.items()}
+    proj = _fields(fields, _TREE_FIELDS)
+    if limit is None and cursor is None:
+        return {typ: [snap.items.project(i, proj) for i in ids] for typ, ids in snap.buckets.items()}
+    return _types_page(snap, cursor, limit, proj)
 
 @app.get("/item/{item_id}")
-def item(item_id: int):
-    """Retourne le détail d'une référence par ID"""
-    if not INDEX_BUILT:
-        raise HTTPException(400, "Index non construit.")
-    if item_id not in ITEMS:
+def item(item_id: int, fields: Optional[str] = None, corpus: str = DEFAULT_CORPUS):
+    """Retourne le détail d'une référence par ID ; ?fields= : projection
+    (date_iso, doc_date sur demande)"""
+    snap = _index(corpus, "Index non construit.")
+    if fields is None:
+        found = snap.items.get(item_id)
+    else:
+        proj = _fields(fields, _ITEM_FIELDS)
+        found = snap.items.project(item_id, proj) if item_id in snap.items else None
+    if found is None:
         raise HTTPException(404, "Item introuvable")
-    return ITEMS[item_id]
+    return found
+
+def _persisted_corpora() -> List[str]:
+    names = set()
+    for base in (STORE_PATH, MMAP_PATH):
+        if base is None:
+            continue
+        if base.exists():
+            names.add(DEFAULT_CORPUS)
+        prefix = f"{base.stem}-"
+        for f in base.parent.glob(f"{prefix}*{base.suffix}"):
+            name = f.name[len(prefix):len(f.name) - len(base.suffix)]
+            if corpus_name_ok(name):
+                names.add(name)
+    return list(names)
+
+@app.get("/corpora")
+def corpora():
+    """Index nommés : ceux en mémoire (taille, génération, source) et ceux
+    persistés mais pas encore chargés (chargés au premier accès)"""
+    loaded = {name: CORPORA.get(name).summary() for name in CORPORA.names()}
+    persisted = sorted(n for n in _persisted_corpora() if n not in loaded)
+    return {"loaded": loaded, "persisted": persisted}
+
+# ===================== CITATIONS =====================
+def _citations(corpus: str) -> CitationGraph:
+    return _index(corpus).citations
+
+@app.get("/citations/cited-by")
+def cited_by(ref: str, corpus: str = DEFAULT_CORPUS):
+    """Documents et dossiers d'installation qui citent la référence normalisée ref"""
+    found = _citations(corpus).cited_by(ref)
+    if found is None:
+        raise HTTPException(404, "Référence introuvable")
+    return found
+
+@app.get("/citations/document")
+def document_citations(file: str, corpus: str = DEFAULT_CORPUS):
+    """Textes cités par un document"""
+    found = _citations(corpus).cites(file)
+    if found is None:
+        raise HTTPException(404, "Document introuvable")
+    return found
+
+@app.get("/citations/top")
+def top_cited(limit: int = Query(20, ge=1, le=1000), type: Optional[str] = None,
+              corpus: str = DEFAULT_CORPUS):
+    """Textes les plus cités (nombre de documents citants)"""
+    return _citations(corpus).top(limit, type)
+
+@app.get("/citations/co-cited")
+def co_cited(ref: str, limit: int = Query(20, ge=1, le=1000), corpus: str = DEFAULT_CORPUS):
+    """Textes cités dans les mêmes documents que ref"""
+    found = _citations(corpus).co_cited(ref, limit)
+    if found is None:
+        raise HTTPException(404, "Référence introuvable")
+    return found
+
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+@app.get("/refs")
+def refs(
+    type: Optional[str] = None,
+    normalized: Optional[str] = None,
+    file: Optional[str] = None,
+    folder: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    q: Optional[str] = None,
+    after: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    corpus: str = DEFAULT_CORPUS,
+):
+    """Recherche dans l'index persisté : filtres par type, référence
+    normalisée, fichier, dossier d'installation, dates (AAAA-MM-JJ, incluses),
+    q : plein texte. Pagination : passer next_after comme after."""
+    for d in (date_from, date_to):
+        if d is not None and not _ISO_DATE.fullmatch(d):
+            raise HTTPException(400, f"Date invalide: {d} (attendu AAAA-MM-JJ)")
+    if not _store_path(_corpus(corpus)).exists():
+        raise HTTPException(400, "Index non construit. Appelle d'abord /index-dir.")
+    found = _store(corpus).query(type=type, normalized=normalized, file=file, folder=folder,
+                                 date_from=date_from, date_to=date_to, q=q, after=after, limit=limit)
+    return {"items": found, "next_after": found[-1]["id"] if len(found) == limit else None}
+
+# ===================== DATES =====================
+def _bounds(date_from: Optional[str], date_to: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    try:
+        lo = parse_bound(date_from) if date_from else None
+        hi = parse_bound(date_to, end=True) if date_to else None
+    except ValueError:
+        raise HTTPException(400, "Borne invalide (attendu AAAA, AAAA-MM ou AAAA-MM-JJ)")
+    return lo, hi
+
+@app.get("/dates/refs")
+def refs_by_date(
+    type: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(100, ge=1, le=10000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    corpus: str = DEFAULT_CORPUS,
+):
+    """Références datées dans un intervalle (bornes incluses, AAAA, AAAA-MM
+    ou AAAA-MM-JJ), triées par date : ?type=decret&from=1977&to=1990"""
+    snap = _index(corpus)
+    lo, hi = _bounds(date_from, date_to)
+    index = snap.ref_dates.get(type)
+    first, last = index.range(lo, hi) if index is not None else (0, 0)
+    total = last - first
+    proj = _fields(fields, _ITEM_FIELDS + ("date_iso",))
+    start = _cursor_start(cursor, snap)
+    end = min(start + limit, total)
+    # seule la page est lue dans l'index trié
+    ids = index.keys(first + start, first + end) if index is not None else []
+    return {
+        "items": [snap.items.project(i, proj) for i in ids],
+        "next_cursor": _next_cursor(end, total, snap),
+        "total": total,
+    }
+
+@app.get("/dates/documents")
+def documents_by_date(
+    folder: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    corpus: str = DEFAULT_CORPUS,
+):
+    """Documents indexés d'un dossier d'installation dans un intervalle de
+    dates, la date d'un document étant lue dans son nom (AAAA-MM-JJ_…) :
+    ?folder=X&from=2018"""
+    snap = _index(corpus)
+    lo, hi = _bounds(date_from, date_to)
+    index = snap.doc_dates.get(folder)
+    keys = index.keys(*index.range(lo, hi)) if index is not None else []
+    files = snap.doc_files
+    return {
+        "documents": [
+            {"file": files[k], "folder": folder_of(files[k]), "date": doc_date(files[k])}
+            for k in keys
+        ],
+        "total": len(keys),
+    }
 
 # ===================== TRAITEMENT ZIP =====================
-def _process_dir_to_zip(input_dir: Path) -> bytes:
-    """Traite tous les fichiers HTML d'un dossier et génère un ZIP annoté"""
-    out_root = input_dir.parent / (input_dir.name + "_annotated")
-    if out_root.exists():
-        for p in out_root.rglob("*"):
-            if p.is_file():
-                p.unlink()
-        for p in sorted(out_root.rglob("*"), reverse=True):
-            if p.is_dir():
-                try:
-                    p.rmdir()
-                except OSError:
-                    pass
-    out_root.mkdir(exist_ok=True)
-
-    html_files = [
-        p for p in input_dir.rglob("*.html")
-        if "__MACOSX" not in str(p) and not p.name.startswith("._")
-    ]
-
-    for f in html_files:
-        raw = f.read_text(encoding="utf-8", errors="ignore")
-        annotated, refs = annotate_html(raw)
-        rel = f.relative_to(input_dir)
-        target_dir = (out_root / rel).parent
-        target_dir.mkdir(parents=True, exist_ok=True)
-
-        (target_dir / (f.stem + "_annotated.html")).write_text(
-            annotated, encoding="utf-8"
-        )
-        (target_dir / (f.stem + "_refs.json")).write_text(
-            json.dumps(refs, ensure_ascii=False, indent=2),
-            encoding="utf-8"
-        )
-
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
-        for p in out_root.rglob("*"):
-            if p.is_file():
-                z.write(p, p.relative_to(out_root))
-    buf.seek(0)
-    return buf.getvalue()
+def _record_zip(stats: Dict[str, Any]):
+    ZIP_SECONDS.inc(stats.get("compress_seconds", 0.0))
+    ZIP_BYTES.inc(stats.get("bytes", 0))
+
+def _zip_sink(root: Path, out: Any = None, refs_format: str = DEFAULT_REFS_FORMAT) -> ZipSink:
+    return ZipSink(root, out, refs_format, stats={})
+
+def _process_dir_to_zip(input_dir: Path, mode: str = DEFAULT_MODE, workers: int = 1,
+                        refs_format: str = DEFAULT_REFS_FORMAT) -> Iterator[bytes]:
+    """Traite tous les fichiers HTML d'un dossier et génère un ZIP annoté,
+    morceau par morceau : chaque document est émis dès qu'il est annoté"""
+    sink = _zip_sink(input_dir, refs_format=refs_format)
+    pipeline = Pipeline(input_dir, [sink], mode, workers, DOC_BUDGET, on_document=_observer(mode))
+    try:
+        for _ in pipeline:
+            data = sink.take()
+            if data:
+                yield data
+        pipeline.close()
+        yield sink.take()
+    finally:
+        _record_zip(sink.stats)
 
 @app.post("/annotate-dir-zip")
 def annotate_dir_zip(payload: DirIn):
@@ -239,14 +890,229 @@ def annotate_dir_zip(payload: DirIn):
     p = Path(payload.path)
     if not p.exists() or not p.is_dir():
         raise HTTPException(404, f"Dossier introuvable: {p}")
+    _check_mode(payload.mode)
+    _check_refs_format(payload.refs_format)
 
-    zip_bytes = _process_dir_to_zip(p)
     return StreamingResponse(
-        io.BytesIO(zip_bytes),
+        _process_dir_to_zip(p, mode=payload.mode, workers=_workers(payload.workers),
+                            refs_format=payload.refs_format),
         media_type="application/zip",
         headers={"Content-Disposition": "attachment; filename=annotated.zip"}
     )
 
+# ==== Archives envoyées : lues au fil de la réception, rien sur disque ====
+# Taille maximale d'une entrée décompressée (contre les bombes de décompression)
+ZIP_MAX_ENTRY = int(os.environ.get("REFS_ZIP_MAX_ENTRY", str(64 * 1024 * 1024)))
+
+async def _zip_upload(request: Request) -> AsyncIterator[Tuple[str, str]]:
+    """(nom, HTML) des entrées HTML de l'archive envoyée en corps brut, dans
+    l'ordre de l'archive. 400 si le corps n'est pas une archive ZIP ; une
+    archive corrompue plus loin lève ValueError pendant la lecture."""
+    chunks = request.stream().__aiter__()
+    head = b""
+    while len(head) < 4:
+        try:
+            head += await chunks.__anext__()
+        except StopAsyncIteration:
+            break
+    if not head.startswith((b"PK\x03\x04", b"PK\x05\x06")):
+        raise HTTPException(400, "Archive ZIP attendue dans le corps de la requête")
+
+    async def entries():
+        reader = ZipReader(max_size=ZIP_MAX_ENTRY)
+        chunk = head
+        while True:
+            for name, data in await run_in_threadpool(reader.feed, chunk):
+                if html_entry(name):
+                    yield name, data.decode("utf-8", errors="ignore")
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+        reader.close()
+
+    return entries()
+
+def _annotate_entry(html: str, mode: str):
+    stats: Dict[str, Any] = {}
+    annotated, refs = annotate_html(html, stats=stats, mode=mode, budget=DOC_BUDGET)
+    return annotated, refs, stats
+
+async def _annotated_upload(entries: AsyncIterator[Tuple[str, str]], mode: str,
+                            refs_format: str) -> AsyncIterator[bytes]:
+    stats: Dict[str, Any] = {}
+    writer = ZipWriter(stats=stats)
+    try:
+        async for name, html in entries:
+            annotated, refs, st = await run_in_threadpool(_annotate_entry, html, mode)
+            _observe(st, (r["type"] for r in refs), mode, name)
+            stem = name.rsplit(".", 1)[0]
+            yield await run_in_threadpool(writer.add, stem + "_annotated.html", annotated)
+            yield writer.add(stem + "_refs.json", dump_refs(refs, refs_format))
+        yield writer.close()
+    except ValueError as e:
+        # réponse déjà commencée : le client reçoit une archive tronquée
+        logger.error(f"❌ Archive envoyée invalide, réponse interrompue : {e}")
+        raise
+    finally:
+        _record_zip(stats)
+
+@app.post("/annotate-zip")
+async def annotate_zip(request: Request, mode: str = DEFAULT_MODE, refs_format: str = DEFAULT_REFS_FORMAT):
+    """Annoter une archive ZIP de fichiers HTML envoyée en corps brut : même
+    archive en retour que /annotate-dir-zip, en flux, entrées dans l'ordre de
+    l'archive. Rien n'est écrit sur disque ; la mémoire est bornée par la plus
+    grosse entrée."""
+    _check_mode(mode)
+    _check_refs_format(refs_format)
+    entries = await _zip_upload(request)
+    return _DuplexStreamingResponse(
+        _annotated_upload(entries, mode, refs_format),
+        media_type="application/zip",
+        headers={"Content-Disposition": "attachment; filename=annotated.zip"},
+    )
+
+def _install_upload_index(corpus: str, entries: List[Dict[str, Any]], meta: Dict[str, str],
+                          timings: Dict[str, float]) -> IndexSnapshot:
+    with _INDEX_LOCK:
+        t0 = perf_counter()
+        try:
+            _store(corpus).replace(entries, meta)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Index SQLite non enregistré ({_store_path(corpus)}) : {e}")
+        t1 = perf_counter()
+        timings["store"] = t1 - t0
+        snap = _set_index(corpus, entries, len(entries) + 1, meta, snippets=True)
+        timings["load"] = perf_counter() - t1
+    timings["total"] = sum(timings.values())
+    _record_build(timings)
+    return snap
+
+@app.post("/index-zip")
+async def index_zip(request: Request, mode: str = DEFAULT_MODE, name: str = "upload",
+                    corpus: str = DEFAULT_CORPUS):
+    """Construire l'index depuis une archive ZIP de fichiers HTML envoyée en
+    corps brut (remplace l'index courant). Les fichiers de l'index sont les
+    chemins dans l'archive ; leurs extraits sont gardés en mémoire, rien
+    n'est écrit sur disque hormis l'index SQLite."""
+    _check_mode(mode)
+    _corpus(corpus)
+    entries: List[Dict[str, Any]] = []
+    files = 0
+    t0 = perf_counter()
+    try:
+        async for file, html in await _zip_upload(request):
+            stats: Dict[str, Any] = {}
+            found = await run_in_threadpool(_index_entries, html, file, mode, DOC_BUDGET, stats)
+            _observe(stats, (e["type"] for e in found), mode, file)
+            entries.extend(found)
+            files += 1
+    except ValueError as e:
+        raise HTTPException(400, f"Archive ZIP invalide : {e}")
+    for item_id, e in enumerate(entries, 1):
+        e["id"] = item_id
+
+    timings = {"annotate": perf_counter() - t0}
+    meta = {"source": f"zip:{name}", "key": f"api:{mode}", "patterns": PATTERNS_VERSION}
+    snap = await run_in_threadpool(_install_upload_index, corpus, entries, meta, timings)
+    return {"ok": True, "corpus": corpus, "types": list(snap.buckets.keys()), "count": len(snap.items),
+            "files": {"annotated": files, "removed": 0, "unchanged": 0}}
+
+# ===================== TÂCHES DE FOND =====================
+# Au plus REFS_MAX_JOBS traitements lourds simultanés (les autres attendent,
+# REFS_JOB_QUEUE au maximum) : les appels interactifs restent rapides.
+JOBS = JobManager(
+    max_running=int(os.environ.get("REFS_MAX_JOBS", "1")),
+    max_queued=int(os.environ.get("REFS_JOB_QUEUE", "8")),
+)
+
+def _submit(kind: str, payload: DirIn, func) -> Dict[str, Any]:
+    p = Path(payload.path)
+    if not p.exists() or not p.is_dir():
+        raise HTTPException(404, f"Dossier introuvable: {p}")
+    _check_mode(payload.mode)
+    _check_refs_format(payload.refs_format)
+    _corpus(payload.corpus)
+    try:
+        job = JOBS.submit(kind, payload.dict(), partial(func, p, payload))
+    except QueueFull:
+        raise HTTPException(503, "File d'attente des tâches pleine, réessayer plus tard",
+                            headers={"Retry-After": "30"})
+    return job.to_dict()
+
+def _index_job(p: Path, payload: DirIn, job: Job):
+    """payload.zip : l'archive annotée est produite dans la même passe"""
+    if not payload.zip:
+        with _INDEX_LOCK:
+            files = _build_index(p, mode=payload.mode, workers=_workers(payload.workers),
+                                 incremental=payload.incremental, job=job, corpus=payload.corpus)
+            snap = CORPORA.get(payload.corpus)
+        return {"corpus": payload.corpus, "types": list(snap.buckets.keys()), "count": len(snap.items),
+                "files": files}
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    job.artifact = JOBS_DIR / f"{job.id}.zip"
+    with open(job.artifact, "wb") as out:
+        sink = _zip_sink(p, out, payload.refs_format)
+        try:
+            with _INDEX_LOCK:
+                files = _build_index(p, mode=payload.mode, workers=_workers(payload.workers),
+                                     incremental=payload.incremental, job=job, corpus=payload.corpus,
+                                     sinks=[sink])
+                snap = CORPORA.get(payload.corpus)
+        finally:
+            _record_zip(sink.stats)
+    return {"corpus": payload.corpus, "types": list(snap.buckets.keys()), "count": len(snap.items),
+            "files": files, "size": job.artifact.stat().st_size}
+
+def _zip_job(p: Path, payload: DirIn, job: Job):
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    job.artifact = JOBS_DIR / f"{job.id}.zip"
+    with open(job.artifact, "wb") as out:
+        sink = _zip_sink(p, out, payload.refs_format)
+        try:
+            Pipeline(p, [sink], payload.mode, _workers(payload.workers), DOC_BUDGET,
+                     on_document=_observer(payload.mode), progress=job).run()
+        finally:
+            _record_zip(sink.stats)
+    return {"size": job.artifact.stat().st_size}
+
+def _job(job_id: str) -> Job:
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Tâche introuvable")
+    return job
+
+@app.post("/jobs/index-dir", status_code=202)
+def submit_index_dir(payload: DirIn):
+    """Lance /index-dir en tâche de fond et renvoie aussitôt son identifiant"""
+    return _submit("index-dir", payload, _index_job)
+
+@app.post("/jobs/annotate-dir-zip", status_code=202)
+def submit_annotate_dir_zip(payload: DirIn):
+    """Lance la production du ZIP annoté en tâche de fond (téléchargement : /jobs/{id}/download)"""
+    return _submit("annotate-dir-zip", payload, _zip_job)
+
+@app.get("/jobs")
+def list_jobs():
+    return [job.to_dict() for job in JOBS.list()]
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """État : fichiers traités / total, références trouvées, ETA (secondes)"""
+    return _job(job_id).to_dict()
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    _job(job_id)
+    return JOBS.cancel(job_id).to_dict()
+
+@app.get("/jobs/{job_id}/download")
+def download_job(job_id: str):
+    job = _job(job_id)
+    if job.artifact is None or job.status != DONE:
+        raise HTTPException(409, f"Aucune archive disponible (état : {job.status})")
+    return FileResponse(job.artifact, media_type="application/zip", filename="annotated.zip")
+
 # ===================== MINI UI =====================
 @app.get("/ui", response_class=HTMLResponse)
 def ui(request: Request):
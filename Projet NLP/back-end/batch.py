@@ -2,85 +2,142 @@
 """
 Utilitaire CLI pour traitement batch de dossiers HTML :
  - indexer un dossier (utilise annotator.annotate_html)
- - produire un zip annoté (utilise api._process_dir_to_zip logic)
+ - produire un zip annoté, écrit au fil de l'eau (même logique que api._process_dir_to_zip)
+ - run : index, zip et export JSONL des références en une seule passe
 Usage :
     python batch.py index /chemin/vers/dossier
     python batch.py zip   /chemin/vers/dossier -o out.zip
+    python batch.py index /chemin/vers/dossier --workers 4
+    python batch.py index /chemin/vers/dossier --incremental
+    python batch.py index /chemin/vers/dossier --db index.sqlite
+    python batch.py index /chemin/vers/dossier --mmap index.refs
+    python batch.py index /chemin/vers/dossier --budget 10
+    python batch.py zip   /chemin/vers/dossier -o out.zip --refs-format compact
+    python batch.py run   /chemin/vers/dossier --index --db index.sqlite --zip out.zip --jsonl refs.jsonl
 """
 
 import sys
 from pathlib import Path
 import argparse
 import json
-import zipfile
-import io
-from annotator import annotate_html
-
-def build_index(input_dir: Path):
+from annotator import MODES, DEFAULT_MODE
+from parallel import default_workers
+from manifest import Manifest, default_manifest_path
+from pipeline import IndexSink, JsonlSink, Pipeline, StatsSink, ZipSink
+from store import RefStore
+from compact import CompactIndex
+from mapped import write_index
+from refsjson import REFS_FORMATS, DEFAULT_REFS_FORMAT
+from annotator import PATTERNS_VERSION
+
+def _warn_partial(f: Path, stats):
+    if stats.get("partial"):
+        print(f"{f}: budget de temps dépassé, analyse partielle (arrêt à la position {stats['cutoff']})",
+              file=sys.stderr)
+
+def _on_document(show_stats: bool = False):
+    def on_document(doc):
+        _warn_partial(doc.file, doc.stats)
+        if show_stats:
+            stats = doc.stats
+            print(f"{doc.file}: {stats['patterns_run']}/{stats['patterns']} patterns exécutés, "
+                  f"{stats['patterns_skipped']} sautés", file=sys.stderr)
+    return on_document
+
+def _index_sink(mode: str, manifest_path: Path = None) -> IndexSink:
+    """manifest_path : index incrémental, seuls les fichiers nouveaux ou
+    modifiés depuis le manifeste sont annotés (le manifeste est mis à jour)"""
+    key = f"batch:{mode}"
+    return IndexSink(Manifest.load(manifest_path, key) if manifest_path else Manifest(None, key))
+
+def _index_result(sink: IndexSink, manifest_path: Path = None):
+    """(items, tree) d'un IndexSink rempli ; enregistre le manifeste"""
+    if manifest_path:
+        sink.manifest.save()
+        files = sink.close()
+        print(f"{files['annotated']} fichiers annotés, {files['removed']} supprimés, "
+              f"{files['unchanged']} inchangés", file=sys.stderr)
     items = {}
     tree = {}
-    next_id = 1
-    html_files = [p for p in input_dir.rglob("*.html") if "__MACOSX" not in str(p) and not p.name.startswith("._")]
-
-    for f in html_files:
-        raw = f.read_text(encoding="utf-8", errors="ignore")
-        annotated, refs = annotate_html(raw)
-        for r in refs:
-            start, end = r["start"], r["end"]
-            snippet = raw[max(0, start-100):end+100].replace("\n", " ")
-            item = {
-                "id": next_id,
-                "type": r["type"],
-                "text": r["text"],
-                "normalized": r.get("normalized", r["text"]),
-                "file": str(f),
-                "snippet": snippet,
-                "href": r.get("href", ""),
-            }
-            items[next_id] = item
-            tree.setdefault(r["type"], []).append({
-                "id": next_id,
-                "text": r["text"],
-                "file": str(f)
-            })
-            next_id += 1
-
+    for item in sink.entries():
+        items[item["id"]] = item
+        tree.setdefault(item["type"], []).append({
+            "id": item["id"],
+            "text": item["text"],
+            "file": item["file"]
+        })
     return items, tree
 
-def create_zip(input_dir: Path, out_path: Path):
-    out_root = input_dir.parent / (input_dir.name + "_annotated")
-    if out_root.exists():
-        # nettoyage simple
-        for p in out_root.rglob("*"):
-            if p.is_file():
-                p.unlink()
-        for p in sorted(out_root.rglob("*"), reverse=True):
-            if p.is_dir():
-                try:
-                    p.rmdir()
-                except OSError:
-                    pass
-    out_root.mkdir(exist_ok=True)
-
-    html_files = [p for p in input_dir.rglob("*.html") if "__MACOSX" not in str(p) and not p.name.startswith("._")]
-
-    for f in html_files:
-        raw = f.read_text(encoding="utf-8", errors="ignore")
-        annotated, refs = annotate_html(raw)
-        rel = f.relative_to(input_dir)
-        target_dir = (out_root / rel).parent
-        target_dir.mkdir(parents=True, exist_ok=True)
-
-        (target_dir / (f.stem + "_annotated.html")).write_text(annotated, encoding="utf-8")
-        (target_dir / (f.stem + "_refs.json")).write_text(json.dumps(refs, ensure_ascii=False, indent=2), encoding="utf-8")
-
-    # créer zip final
-    with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as z:
-        for p in out_root.rglob("*"):
-            if p.is_file():
-                z.write(p, p.relative_to(out_root))
-
-    print(f"Zip créé: {out_path}")
+def build_index(input_dir: Path, show_stats: bool = False, mode: str = DEFAULT_MODE, workers: int = 1,
+                manifest_path: Path = None, budget: float = None):
+    """manifest_path : index incrémental, seuls les fichiers nouveaux ou
+    modifiés depuis le manifeste sont annotés (le manifeste est mis à jour).
+    budget : temps maximal de recherche par document (résultat partiel au-delà)"""
+    sink = _index_sink(mode, manifest_path)
+    Pipeline(input_dir, [sink], mode, workers, budget, on_document=_on_document(show_stats)).run()
+    return _index_result(sink, manifest_path)
+
+def _save_index(path: Path, items, mode: str, db: str = None, mmap: str = None):
+    """Écrit l'index dans la base SQLite et / ou le fichier projeté demandés"""
+    meta = {"source": str(path), "key": f"batch:{mode}", "patterns": PATTERNS_VERSION}
+    if db:
+        RefStore(Path(db)).replace(items.values(), meta)
+    if mmap:
+        next_id = max(items, default=0) + 1
+        write_index(Path(mmap), CompactIndex(items.values()), next_id, meta)
+
+def _open_out(path: str, binary: bool):
+    """Fichier de sortie ("-" : sortie standard)"""
+    if path == "-":
+        return sys.stdout.buffer if binary else sys.stdout
+    return open(path, "wb") if binary else open(path, "w", encoding="utf-8")
+
+def create_zip(input_dir: Path, out_path: Path, mode: str = DEFAULT_MODE, workers: int = 1,
+               budget: float = None, refs_format: str = DEFAULT_REFS_FORMAT):
+    """Écrit l'archive au fil de l'annotation (out_path "-" : sortie standard)"""
+    out = _open_out(str(out_path), binary=True)
+    try:
+        Pipeline(input_dir, [ZipSink(input_dir, out, refs_format)], mode, workers, budget,
+                 on_document=_on_document()).run()
+    finally:
+        if out is sys.stdout.buffer:
+            out.flush()
+        else:
+            out.close()
+    if str(out_path) != "-":
+        print(f"Zip créé: {out_path}")
+
+def run(input_dir: Path, index: bool = False, zip_path: str = None, jsonl_path: str = None,
+        mode: str = DEFAULT_MODE, workers: int = 1, budget: float = None,
+        refs_format: str = DEFAULT_REFS_FORMAT, manifest_path: Path = None,
+        db: str = None, mmap: str = None):
+    """Toutes les sorties demandées en une passe : chaque fichier est lu et
+    annoté une fois. Renvoie les résumés des sorties (et stats du corpus)."""
+    sinks = [StatsSink()]
+    outs = []
+    index_sink = None
+    if index:
+        index_sink = _index_sink(mode, manifest_path)
+        sinks.append(index_sink)
+    if zip_path:
+        outs.append(_open_out(zip_path, binary=True))
+        sinks.append(ZipSink(input_dir, outs[-1], refs_format))
+    if jsonl_path:
+        outs.append(_open_out(jsonl_path, binary=False))
+        sinks.append(JsonlSink(outs[-1]))
+    try:
+        summary = Pipeline(input_dir, sinks, mode, workers, budget, on_document=_on_document()).run()
+    finally:
+        for out in outs:
+            if out in (sys.stdout, sys.stdout.buffer):
+                out.flush()
+            else:
+                out.close()
+    if index_sink is not None:
+        items, tree = _index_result(index_sink, manifest_path)
+        _save_index(input_dir, items, mode, db, mmap)
+        summary["index"] = {"count": len(items), "types": list(tree.keys()), "files": summary["index"]}
+    return summary
 
 def main(argv=None):
     parser = argparse.ArgumentParser(description="Batch processor for legal references annotation")
@@ -88,24 +145,81 @@ def main(argv=None):
 
     p_index = sub.add_parser("index", help="Index a directory")
     p_index.add_argument("path", type=str, help="Directory to index")
+    p_index.add_argument("--stats", action="store_true", help="Print per-document pattern execution stats")
+    p_index.add_argument("--mode", choices=MODES, default=DEFAULT_MODE, help="Scan raw HTML or text nodes only")
+    p_index.add_argument("--workers", type=int, default=1, help="Worker processes (default 1, max = CPU cores)")
+    p_index.add_argument("--incremental", action="store_true",
+                         help="Only annotate files new or changed since the last run (uses a manifest)")
+    p_index.add_argument("--manifest", type=str, default=None,
+                         help="Manifest file for --incremental (default: <dir>_batch_index.json next to the directory)")
+    p_index.add_argument("--db", type=str, default=None, help="Also write the index to this SQLite file")
+    p_index.add_argument("--mmap", type=str, default=None,
+                         help="Also write a memory-mapped index file, shared by API workers (REFS_INDEX_MMAP)")
+    p_index.add_argument("--budget", type=float, default=None,
+                         help="Max scan time per document in seconds (partial results beyond)")
 
     p_zip = sub.add_parser("zip", help="Produce annotated zip")
     p_zip.add_argument("path", type=str, help="Directory to process")
-    p_zip.add_argument("-o", "--out", type=str, default="annotated.zip", help="Output zip file")
+    p_zip.add_argument("-o", "--out", type=str, default="annotated.zip", help="Output zip file ('-' for stdout)")
+    p_zip.add_argument("--mode", choices=MODES, default=DEFAULT_MODE, help="Scan raw HTML or text nodes only")
+    p_zip.add_argument("--workers", type=int, default=1, help="Worker processes (default 1, max = CPU cores)")
+    p_zip.add_argument("--budget", type=float, default=None,
+                       help="Max scan time per document in seconds (partial results beyond)")
+    p_zip.add_argument("--refs-format", choices=REFS_FORMATS, default=DEFAULT_REFS_FORMAT,
+                       help="_refs.json layout: indented objects or compact columns")
+
+    p_run = sub.add_parser("run", help="Produce several outputs in a single pass over the directory")
+    p_run.add_argument("path", type=str, help="Directory to process")
+    p_run.add_argument("--index", action="store_true", help="Build the index (see --db, --mmap, --incremental)")
+    p_run.add_argument("--zip", type=str, default=None, help="Write the annotated zip to this file ('-' for stdout)")
+    p_run.add_argument("--jsonl", type=str, default=None,
+                       help="Write one JSON line per reference to this file ('-' for stdout)")
+    p_run.add_argument("--mode", choices=MODES, default=DEFAULT_MODE, help="Scan raw HTML or text nodes only")
+    p_run.add_argument("--workers", type=int, default=1, help="Worker processes (default 1, max = CPU cores)")
+    p_run.add_argument("--budget", type=float, default=None,
+                       help="Max scan time per document in seconds (partial results beyond)")
+    p_run.add_argument("--refs-format", choices=REFS_FORMATS, default=DEFAULT_REFS_FORMAT,
+                       help="_refs.json layout: indented objects or compact columns")
+    p_run.add_argument("--incremental", action="store_true",
+                       help="Index: only new or changed files (the other outputs still cover every file)")
+    p_run.add_argument("--manifest", type=str, default=None,
+                       help="Manifest file for --incremental (default: <dir>_batch_index.json next to the directory)")
+    p_run.add_argument("--db", type=str, default=None, help="Index: also write it to this SQLite file")
+    p_run.add_argument("--mmap", type=str, default=None, help="Index: also write a memory-mapped index file")
 
     args = parser.parse_args(argv)
+    if args.cmd in ("index", "run") and args.manifest and not args.incremental:
+        parser.error(f"{args.cmd} : --manifest s'utilise avec --incremental")
 
     path = Path(args.path)
     if not path.exists() or not path.is_dir():
         print("Le chemin indiqué n'existe pas ou n'est pas un dossier.")
         sys.exit(1)
 
+    workers = max(1, min(args.workers, default_workers()))
+    manifest_path = None
+    if args.cmd in ("index", "run") and args.incremental:
+        manifest_path = Path(args.manifest) if args.manifest else default_manifest_path(path, "_batch_index.json")
     if args.cmd == "index":
-        items, tree = build_index(path)
+        items, tree = build_index(path, show_stats=args.stats, mode=args.mode, workers=workers,
+                                  manifest_path=manifest_path, budget=args.budget)
+        _save_index(path, items, args.mode, args.db, args.mmap)
         print(json.dumps({"count": len(items), "types": list(tree.keys())}, ensure_ascii=False, indent=2))
     elif args.cmd == "zip":
         out = Path(args.out)
-        create_zip(path, out)
+        create_zip(path, out, mode=args.mode, workers=workers, budget=args.budget,
+                   refs_format=args.refs_format)
+    elif args.cmd == "run":
+        if not (args.index or args.zip or args.jsonl):
+            parser.error("run : au moins une sortie parmi --index, --zip, --jsonl")
+        if args.zip == "-" and args.jsonl == "-":
+            parser.error("run : --zip et --jsonl ne peuvent pas partager la sortie standard")
+        summary = run(path, index=args.index, zip_path=args.zip, jsonl_path=args.jsonl, mode=args.mode,
+                      workers=workers, budget=args.budget, refs_format=args.refs_format,
+                      manifest_path=manifest_path, db=args.db, mmap=args.mmap)
+        # résumé sur stderr si une sortie occupe la sortie standard
+        report = sys.stderr if "-" in (args.zip, args.jsonl) else sys.stdout
+        print(json.dumps(summary, ensure_ascii=False, indent=2), file=report)
 
 if __name__ == "__main__":
     main()
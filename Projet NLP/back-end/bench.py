@@ -0,0 +1,361 @@
+# bench.py
+"""
+Mesure de performance de l'annotateur.
+Corpus : un dossier de fichiers HTML (../data) ou un corpus synthétique
+généré à la volée, de taille quelconque (--synthetic N --doc-size KO).
+Rapport, par moteur et par mode d'analyse ("raw" : HTML brut, "text" :
+nœuds texte) : octets parcourus, Mo/s, latence par document (p50 / p99),
+références trouvées, temps de recherche / résolution des chevauchements /
+reconstruction du HTML ; avec --patterns, temps et nombre de
+correspondances de chaque entrée de PATTERNS ; avec --adversarial, temps
+sur des textes adverses de taille croissante (croissance linéaire attendue)
+et respect du budget de temps par document.
+Le rapport peut être enregistré (--save) puis servir de référence
+(--compare) : toute régression au-delà du seuil est signalée (code 1).
+Usage :
+    python bench.py ../data
+    python bench.py ../data --engine all --repeat 3
+    python bench.py ../data --patterns --repeat 3 --save baseline.json
+    python bench.py ../data --patterns --repeat 3 --compare baseline.json
+    python bench.py --synthetic 20000 --doc-size 16
+    python bench.py --synthetic 20 --doc-size 4096     # fichiers de 4 Mo
+    python bench.py ../data --adversarial
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from annotator import annotate_html, ENGINES, DEFAULT_ENGINE, MODES, PATTERNS, PATTERNS_VERSION, MOIS
+
+# Écarts de temps sous ce plancher (secondes) ignorés par la comparaison :
+# bruit de mesure, pas régression
+_NOISE_FLOOR = 0.005
+
+
+def load_corpus(input_dir: Path):
+    html_files = sorted(
+        p for p in input_dir.rglob("*.html")
+        if "__MACOSX" not in str(p) and not p.name.startswith("._")
+    )
+    return [f.read_text(encoding="utf-8", errors="ignore") for f in html_files]
+
+
+# ---------- corpus synthétique ----------
+_MONTHS = MOIS.split("|")
+_FILLER = (
+    "Considérant que l'exploitant a déposé un dossier de demande",
+    "les prescriptions du présent titre s'appliquent aux installations existantes",
+    "l'inspection des installations classées a procédé à une visite du site",
+    "les eaux pluviales susceptibles d'être polluées sont collectées",
+    "la hauteur de la cheminée est fixée à vingt mètres au-dessus du sol",
+    "Sur proposition du secrétaire général de la préfecture",
+    "les valeurs limites d'émission sont rappelées en annexe",
+    "l'exploitant tient à jour un registre des déchets produits",
+)
+_REFS = (
+    lambda r, d: f"décret n° {r.randint(60, 99)}-{r.randint(1, 1999)} du {d}",
+    lambda r, d: f"arrêté ministériel du {d}",
+    lambda r, d: f"arrêté préfectoral n° {r.randint(1990, 2023)}-{r.randint(1, 999)} du {d}",
+    lambda r, d: f"arrêté du {d}",
+    lambda r, d: f"loi n° {r.randint(70, 99)}-{r.randint(1, 999)} du {d}",
+    lambda r, d: f"circulaire du {d}",
+    lambda r, d: f"directive {r.randint(1990, 2020)}/{r.randint(1, 120)}/UE du {d}",
+    lambda r, d: f"article L. {r.randint(100, 599)}-{r.randint(1, 30)}",
+    lambda r, d: "code de l'environnement",
+    lambda r, d: "le présent arrêté",
+    lambda r, d: f"norme NF EN {r.randint(1000, 15000)}",
+)
+
+
+def _date(r: random.Random) -> str:
+    day = "1er" if r.random() < 0.1 else str(r.randint(2, 28))
+    return f"{day} {r.choice(_MONTHS)} {r.randint(1970, 2023)}"
+
+
+def synthetic_doc(i: int, size: int, seed: int = 0) -> str:
+    """Document HTML de ~size octets, reproductible (même i, même seed)"""
+    r = random.Random(seed * 1_000_003 + i)
+    parts = ["<html><body><div class=\"dsr-arrete\">"]
+    n = len(parts[0])
+    while n < size:
+        words = [r.choice(_FILLER)]
+        for _ in range(r.randint(0, 2)):
+            ref = r.choice(_REFS)(r, _date(r))
+            # une référence sur dix coupée par une balise en ligne (mode "text")
+            if r.random() < 0.1 and " du " in ref:
+                head, _, tail = ref.partition(" du ")
+                ref = f"{head} du <b>{tail}</b>"
+            words.append(f"vu le {ref}")
+            words.append(r.choice(_FILLER))
+        line = f"<div class=\"dsr-visa\"><p>{', '.join(words)} ;</p></div>\n"
+        parts.append(line)
+        n += len(line)
+    parts.append("</div></body></html>")
+    return "".join(parts)
+
+
+class SyntheticCorpus(Sequence):
+    """n documents générés à la demande : la mémoire ne dépend pas de n"""
+
+    def __init__(self, n: int, size: int, seed: int = 0):
+        self.n, self.size, self.seed = n, size, seed
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(self.n))]
+        if not -self.n <= i < self.n:
+            raise IndexError(i)
+        return synthetic_doc(i % self.n, self.size, self.seed)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self.n):
+            yield synthetic_doc(i, self.size, self.seed)
+
+
+# ---------- mesures ----------
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Rang le plus proche (valeurs déjà triées)"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(q * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def bench_mode(docs, mode: str, engine: str, repeat: int = 1) -> Dict[str, Any]:
+    """Meilleur des repeat passages, document par document"""
+    per_doc: Optional[List[float]] = None
+    scanned = refs = 0
+    stages = {"scan": 0.0, "resolve": 0.0, "render": 0.0}
+    for _ in range(repeat):
+        times = []
+        scanned = refs = 0
+        run_stages = {"scan": 0.0, "resolve": 0.0, "render": 0.0}
+        for raw in docs:
+            stats = {}
+            t0 = time.perf_counter()
+            _, found = annotate_html(raw, engine=engine, stats=stats, mode=mode)
+            times.append(time.perf_counter() - t0)
+            scanned += stats["bytes_scanned"]
+            refs += len(found)
+            for stage in run_stages:
+                run_stages[stage] += stats.get(f"{stage}_seconds", 0.0)
+        if per_doc is None or sum(times) < sum(per_doc):
+            per_doc, stages = times, run_stages
+    per_doc = per_doc or []
+    total = sum(per_doc)
+    ranked = sorted(per_doc)
+    return {
+        "mode": mode,
+        "engine": engine,
+        "documents": len(per_doc),
+        "bytes_scanned": scanned,
+        "seconds": round(total, 4),
+        "mb_per_s": round(scanned / 1e6 / total, 2) if total else None,
+        "p50_ms": round(_percentile(ranked, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(ranked, 0.99) * 1000, 3),
+        "references": refs,
+        "stages": {stage: round(t, 4) for stage, t in stages.items()},
+    }
+
+
+def bench_patterns(docs, repeat: int = 1) -> List[Dict[str, Any]]:
+    """Coût propre de chaque pattern : un finditer sur tout le corpus (HTML
+    brut), correspondances comptées avant résolution des chevauchements.
+    Documents en boucle externe : un document synthétique n'est généré
+    qu'une fois par passage, hors mesure."""
+    best: List[Optional[float]] = [None] * len(PATTERNS)
+    matches = [0] * len(PATTERNS)
+    for _ in range(repeat):
+        seconds = [0.0] * len(PATTERNS)
+        matches = [0] * len(PATTERNS)
+        for raw in docs:
+            for i, (_, reg, _) in enumerate(PATTERNS):
+                t0 = time.perf_counter()
+                n = sum(1 for _ in reg.finditer(raw))
+                seconds[i] += time.perf_counter() - t0
+                matches[i] += n
+        best = [t if b is None else min(b, t) for b, t in zip(best, seconds)]
+    return [
+        {
+            "index": i,
+            "type": typ,
+            "pattern": reg.pattern[:80],
+            "seconds": round(best[i] or 0.0, 4),
+            "matches": matches[i],
+        }
+        for i, (typ, reg, _) in enumerate(PATTERNS)
+    ]
+
+
+# ---------- entrées adverses ----------
+# Longs textes OCR sans ponctuation répétant le début d'un pattern à partie
+# libre ("loi sur les …", "arrêté du Ministre de …") : chaque tentative
+# parcourt la suite du texte si la partie libre n'est pas bornée, soit un
+# temps quadratique.
+ADVERSARIAL = {
+    "loi_sur": "la loi sur les eaux usées ",
+    "arrete_ministre": "arrêté du Ministre de la santé ",
+    "instruction_ministere": "instruction du Ministère de la santé ",
+    "norme": "norme NF EN 12 ",
+    "decret_sans_date": "décret n° 77-1133 du 21 ",
+    "present_arrete": "le présent arrêté ",
+}
+_ADVERSARIAL_SCALES = (1, 4, 16)
+_ADVERSARIAL_BUDGET = 0.05
+
+
+def _adversarial_doc(unit: str, size: int) -> str:
+    return "<p>" + unit * (size // len(unit)) + "</p>"
+
+
+def bench_adversarial(size: int = 16 * 1024, repeat: int = 1) -> List[Dict[str, Any]]:
+    """
+    Temps de chaque entrée adverse pour des tailles size x 1, 4, 16 :
+    linear est faux si le temps croît plus de deux fois plus vite que la
+    taille. budget_ms : durée de l'analyse de la plus grande entrée avec un
+    budget de 50 ms (résultat partiel), qui doit rester proche du budget.
+    """
+    results = []
+    for name, unit in ADVERSARIAL.items():
+        seconds = []
+        for scale in _ADVERSARIAL_SCALES:
+            doc = _adversarial_doc(unit, size * scale)
+            best = None
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                annotate_html(doc)
+                elapsed = time.perf_counter() - t0
+                best = elapsed if best is None else min(best, elapsed)
+            seconds.append(best)
+        stats = {}
+        t0 = time.perf_counter()
+        annotate_html(doc, stats=stats, budget=_ADVERSARIAL_BUDGET)
+        budget_s = time.perf_counter() - t0
+        growth = seconds[-1] / max(seconds[0], 1e-6)
+        results.append({
+            "input": name,
+            "sizes": [size * scale for scale in _ADVERSARIAL_SCALES],
+            "seconds": [round(t, 4) for t in seconds],
+            "growth": round(growth, 1),
+            "linear": growth <= 2 * _ADVERSARIAL_SCALES[-1],
+            "budget_ms": round(budget_s * 1000, 1),
+            "budget_partial": bool(stats.get("partial")),
+        })
+    return results
+
+
+# ---------- références enregistrées ----------
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Régressions de report par rapport à baseline : temps total, p99 ou temps
+    d'un pattern plus de threshold au-dessus (et au-delà du bruit), nombre de
+    références ou de correspondances différent (changement de rappel).
+    """
+    problems = []
+
+    def slower(name: str, new: float, old: float, floor: float):
+        if old and new > old * (1 + threshold) and new - old > floor:
+            problems.append(f"{name}: {old} -> {new} (+{(new / old - 1) * 100:.0f} %)")
+
+    if baseline.get("corpus") != report.get("corpus"):
+        problems.append(f"corpus différent: {baseline.get('corpus')} -> {report.get('corpus')}")
+    old_runs = {(r["engine"], r["mode"]): r for r in baseline.get("runs", [])}
+    for run in report["runs"]:
+        old = old_runs.get((run["engine"], run["mode"]))
+        if old is None:
+            continue
+        name = f"{run['engine']}/{run['mode']}"
+        slower(f"{name} seconds", run["seconds"], old["seconds"], _NOISE_FLOOR)
+        slower(f"{name} p99_ms", run["p99_ms"], old["p99_ms"], _NOISE_FLOOR * 1000)
+        if run["references"] != old["references"]:
+            problems.append(f"{name} references: {old['references']} -> {run['references']}")
+
+    old_patterns = {(p["index"], p["pattern"]): p for p in baseline.get("patterns") or []}
+    for p in report.get("patterns") or []:
+        old = old_patterns.get((p["index"], p["pattern"]))
+        if old is None:
+            continue
+        name = f"pattern {p['index']} ({p['type']})"
+        slower(f"{name} seconds", p["seconds"], old["seconds"], _NOISE_FLOOR)
+        if p["matches"] != old["matches"]:
+            problems.append(f"{name} matches: {old['matches']} -> {p['matches']}")
+
+    for a in report.get("adversarial") or []:
+        if not a["linear"]:
+            problems.append(f"adversarial {a['input']}: temps x{a['growth']} pour une taille x{_ADVERSARIAL_SCALES[-1]}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of the legal references annotator")
+    parser.add_argument("path", type=str, nargs="?", help="Directory of HTML files")
+    parser.add_argument("--synthetic", type=int, metavar="N",
+                        help="Use N generated documents instead of a directory")
+    parser.add_argument("--doc-size", type=int, default=16, metavar="KB",
+                        help="Size of each generated document (default: 16 KB)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated corpus")
+    parser.add_argument("--engine", choices=ENGINES + ("all",), default=DEFAULT_ENGINE)
+    parser.add_argument("--repeat", type=int, default=1, help="Keep the best of N runs")
+    parser.add_argument("--patterns", action="store_true", help="Profile each entry of PATTERNS")
+    parser.add_argument("--adversarial", action="store_true",
+                        help="Time adversarial inputs of growing size and the per-document time budget")
+    parser.add_argument("--save", type=str, metavar="FILE", help="Write the report as a JSON baseline")
+    parser.add_argument("--compare", type=str, metavar="FILE",
+                        help="Compare with a saved baseline; exit code 1 on regression")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="Relative slowdown reported as a regression (default: 0.20)")
+    args = parser.parse_args(argv)
+
+    if args.synthetic:
+        docs = SyntheticCorpus(args.synthetic, args.doc_size * 1024, args.seed)
+        corpus = f"synthetic:{args.synthetic}x{args.doc_size}KB:seed={args.seed}"
+    else:
+        path = Path(args.path or "")
+        if not args.path or not path.exists() or not path.is_dir():
+            print("Le chemin indiqué n'existe pas ou n'est pas un dossier.")
+            sys.exit(1)
+        docs = load_corpus(path)
+        corpus = str(path)
+
+    engines = ENGINES if args.engine == "all" else (args.engine,)
+    report = {
+        "corpus": corpus,
+        "patterns_version": PATTERNS_VERSION,
+        "python": platform.python_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "runs": [
+            bench_mode(docs, mode, engine, args.repeat)
+            for engine in engines
+            for mode in MODES
+        ],
+        "patterns": bench_patterns(docs, args.repeat) if args.patterns else None,
+        "adversarial": bench_adversarial(repeat=args.repeat) if args.adversarial else None,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if baseline.get("patterns_version") != PATTERNS_VERSION:
+            print(f"Patterns modifiés depuis la référence ({baseline.get('patterns_version')} -> "
+                  f"{PATTERNS_VERSION}) : les écarts de correspondances sont attendus", file=sys.stderr)
+        problems = compare(report, baseline, args.threshold)
+        for line in problems:
+            print(f"RÉGRESSION {line}", file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print("Aucune régression", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# cache.py
+"""
+Cache des résultats d'annotation, adressé par contenu.
+Exporte :
+ - content_key(data, *variant) -> empreinte du contenu + PATTERNS_VERSION + variantes
+ - ResultCache(max_bytes) : LRU borné par taille totale en octets, avec compteurs
+
+Le résultat d'annotation ne dépend que du document, du mode et du jeu de
+patterns : la clé sert aussi d'ETag, sans avoir à recalculer quoi que ce soit.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from annotator import PATTERNS_VERSION
+
+
+def content_key(data: bytes, *variant: str) -> str:
+    h = hashlib.sha256(data)
+    h.update("\0".join((PATTERNS_VERSION,) + variant).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Valeurs : octets (réponse déjà sérialisée). max_bytes = 0 : désactivé."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.not_modified = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._data[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def note_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "not_modified": self.not_modified,
+            }
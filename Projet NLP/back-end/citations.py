@@ -0,0 +1,102 @@
+# citations.py
+"""
+Graphe des citations : quels documents citent quels textes.
+Exporte :
+ - CitationGraph(items) : index inversé référence normalisée -> documents
+   (et dossiers d'installation) qui la citent, et document -> textes cités
+
+Tout est précalculé à la construction de l'index : chaque requête ne
+parcourt que son résultat (ou, pour les co-citations, les documents qui
+citent le texte demandé), jamais l'ensemble des entrées.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def folder_of(file: str) -> str:
+    """Dossier d'installation : data/<id>/fichier.html"""
+    return Path(file).parent.name
+
+
+def _key(ref: str) -> str:
+    # certains normaliseurs laissent un espace final ("présent arrêté ")
+    return ref.strip()
+
+
+class CitationGraph:
+    __slots__ = ("by_ref", "by_doc", "types", "_top", "_top_by_type")
+
+    def __init__(self, items: Iterable[Dict[str, Any]]):
+        # référence -> {fichier: nombre de citations}, dans l'ordre des fichiers
+        self.by_ref: Dict[str, Dict[str, int]] = {}
+        # fichier -> {référence: nombre de citations}
+        self.by_doc: Dict[str, Dict[str, int]] = {}
+        self.types: Dict[str, str] = {}
+        for item in items:
+            ref = _key(item.get("normalized") or item["text"])
+            docs = self.by_ref.setdefault(ref, {})
+            docs[item["file"]] = docs.get(item["file"], 0) + 1
+            refs = self.by_doc.setdefault(item["file"], {})
+            refs[ref] = refs.get(ref, 0) + 1
+            self.types.setdefault(ref, item["type"])
+
+        # classement : nombre de documents citants, puis de citations
+        ranked = sorted(
+            self.by_ref,
+            key=lambda r: (-len(self.by_ref[r]), -sum(self.by_ref[r].values()), r),
+        )
+        self._top = ranked
+        self._top_by_type: Dict[str, List[str]] = {}
+        for ref in ranked:
+            self._top_by_type.setdefault(self.types[ref], []).append(ref)
+
+    def _summary(self, ref: str) -> Dict[str, Any]:
+        docs = self.by_ref[ref]
+        return {
+            "ref": ref,
+            "type": self.types[ref],
+            "documents": len(docs),
+            "citations": sum(docs.values()),
+        }
+
+    def cited_by(self, ref: str) -> Optional[Dict[str, Any]]:
+        """Documents et dossiers d'installation qui citent ref"""
+        ref = _key(ref)
+        docs = self.by_ref.get(ref)
+        if docs is None:
+            return None
+        folders: Dict[str, int] = {}
+        for f in docs:
+            folders[folder_of(f)] = folders.get(folder_of(f), 0) + 1
+        return {
+            **self._summary(ref),
+            "files": [{"file": f, "folder": folder_of(f), "count": n} for f, n in docs.items()],
+            "folders": [{"folder": d, "documents": n} for d, n in folders.items()],
+        }
+
+    def cites(self, file: str) -> Optional[List[Dict[str, Any]]]:
+        """Textes cités par un document"""
+        refs = self.by_doc.get(file)
+        if refs is None:
+            return None
+        return [{"ref": r, "type": self.types[r], "count": n} for r, n in refs.items()]
+
+    def top(self, limit: int = 20, type: Optional[str] = None) -> List[Dict[str, Any]]:
+        ranked = self._top if type is None else self._top_by_type.get(type, [])
+        return [self._summary(r) for r in ranked[:limit]]
+
+    def co_cited(self, ref: str, limit: int = 20) -> Optional[List[Dict[str, Any]]]:
+        """Textes cités dans les mêmes documents que ref, par nombre de
+        documents communs"""
+        ref = _key(ref)
+        docs = self.by_ref.get(ref)
+        if docs is None:
+            return None
+        common: Dict[str, int] = {}
+        for f in docs:
+            for other in self.by_doc[f]:
+                if other != ref:
+                    common[other] = common.get(other, 0) + 1
+        ranked = sorted(common.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+        return [{"ref": r, "type": self.types[r], "documents": n} for r, n in ranked]
@@ -0,0 +1,207 @@
+# compact.py
+"""
+Représentation compacte, en colonnes, des références indexées.
+Exporte :
+ - CompactIndex(entries) : mêmes entrées que l'index en dictionnaires,
+   stockées en tableaux d'entiers et chaînes internées
+ - read_source(file) -> contenu d'un fichier indexé (petit cache LRU,
+   clé : chemin, date de modification et taille)
+
+Une référence coûte quelques entiers : type, fichier, texte, forme
+normalisée et date sont des indices dans des tables de chaînes uniques, la
+date ISO un ordinal ; href est recalculé depuis (type, normalized), la date
+du document depuis le nom du fichier, et l'extrait (snippet) est relu dans
+le fichier source, depuis (file, start, end), quand on le demande ; sauf
+pour un index sans fichiers sources (archive envoyée) : snippets=True
+garde alors les extraits des entrées.
+"""
+
+import os
+from array import array
+from bisect import bisect_left
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from annotator import ref_href
+from dates import doc_date, ordinal
+
+SNIPPET_CONTEXT = 100
+
+
+def read_source(file: str) -> str:
+    """Contenu du fichier ; un fichier modifié depuis sa mise en cache
+    (date ou taille différente) est relu"""
+    st = os.stat(file)
+    return _read_source(file, st.st_mtime_ns, st.st_size)
+
+
+@lru_cache(maxsize=16)
+def _read_source(file: str, mtime_ns: int, size: int) -> str:
+    with open(file, encoding="utf-8", errors="ignore") as fh:
+        return fh.read()
+
+
+def make_snippet(raw: str, start: int, end: int) -> str:
+    return raw[max(0, start - SNIPPET_CONTEXT):end + SNIPPET_CONTEXT].replace("\n", " ")
+
+
+class _Strings:
+    """Table de chaînes uniques : chaîne <-> indice"""
+    __slots__ = ("values", "_index")
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._index: Dict[Optional[str], int] = {}
+
+    def add(self, value: Optional[str]) -> int:
+        i = self._index.get(value)
+        if i is None:
+            i = self._index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def freeze(self):
+        """Plus d'ajout : la table inverse n'est plus utile"""
+        self._index = {}
+
+
+class CompactIndex:
+    """
+    Entrées dans l'ordre de l'index (ordre des fichiers), adressées par ID.
+    Les champs et leur ordre dans get() sont ceux de l'index en
+    dictionnaires (id, type, text, normalized, file, date, snippet, href) ;
+    date_iso et doc_date s'obtiennent par project().
+    """
+
+    FIELDS = ("id", "type", "text", "normalized", "file", "date", "snippet", "href")
+
+    __slots__ = (
+        "_ids", "_type", "_file", "_text", "_norm", "_date", "_day", "_start", "_end",
+        "_types", "_files", "_texts", "_dates", "_sorted_ids", "_sorted_rows", "_snippets",
+    )
+
+    def __init__(self, entries: Iterable[Dict[str, Any]], snippets: bool = False):
+        self._ids, self._start, self._end = array("I"), array("I"), array("I")
+        self._type, self._file = array("H"), array("I")
+        self._text, self._norm, self._date = array("I"), array("I"), array("I")
+        self._day = array("i")  # ordinal de la date ISO, 0 si aucune
+        self._types, self._files, self._texts, self._dates = _Strings(), _Strings(), _Strings(), _Strings()
+        self._snippets: Optional[List[str]] = [] if snippets else None
+
+        for e in entries:
+            self._ids.append(e["id"])
+            self._type.append(self._types.add(e["type"]))
+            self._file.append(self._files.add(e["file"]))
+            self._text.append(self._texts.add(e["text"]))
+            # la forme normalisée partage la table des textes (souvent identiques)
+            self._norm.append(self._texts.add(e["normalized"]))
+            self._date.append(self._dates.add(e.get("date")))
+            self._day.append(ordinal(e.get("date_iso")))
+            self._start.append(e["start"])
+            self._end.append(e["end"])
+            if self._snippets is not None:
+                self._snippets.append(e.get("snippet") or "")
+        for table in (self._types, self._files, self._texts, self._dates):
+            table.freeze()
+
+        order = sorted(range(len(self._ids)), key=self._ids.__getitem__)
+        self._sorted_ids = array("I", (self._ids[r] for r in order))
+        self._sorted_rows = array("I", order)
+
+    # ---------- accès ----------
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _row(self, item_id: int) -> Optional[int]:
+        k = bisect_left(self._sorted_ids, item_id)
+        if k < len(self._sorted_ids) and self._sorted_ids[k] == item_id:
+            return self._sorted_rows[k]
+        return None
+
+    def __contains__(self, item_id: int) -> bool:
+        return self._row(item_id) is not None
+
+    def ids(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def _field(self, row: int, name: str) -> Any:
+        if name == "id":
+            return self._ids[row]
+        if name == "type":
+            return self._types.values[self._type[row]]
+        if name == "text":
+            return self._texts.values[self._text[row]]
+        if name == "normalized":
+            return self._texts.values[self._norm[row]]
+        if name == "file":
+            return self._files.values[self._file[row]]
+        if name == "date":
+            return self._dates.values[self._date[row]]
+        if name == "date_iso":
+            day = self._day[row]
+            return date.fromordinal(day).isoformat() if day else None
+        if name == "doc_date":
+            return doc_date(self._files.values[self._file[row]])
+        if name == "href":
+            return ref_href(self._field(row, "type"), self._field(row, "normalized"))
+        if name == "snippet":
+            if self._snippets is not None:
+                return self._snippets[row]
+            raw = read_source(self._files.values[self._file[row]])
+            return make_snippet(raw, self._start[row], self._end[row])
+        if name == "start":
+            return self._start[row]
+        if name == "end":
+            return self._end[row]
+        raise KeyError(name)
+
+    def project(self, item_id: int, fields: Tuple[str, ...]) -> Dict[str, Any]:
+        row = self._row(item_id)
+        if row is None:
+            raise KeyError(item_id)
+        return {f: self._field(row, f) for f in fields}
+
+    def get(self, item_id: int) -> Optional[Dict[str, Any]]:
+        """Entrée complète (extrait relu dans le fichier source)"""
+        row = self._row(item_id)
+        if row is None:
+            return None
+        return {f: self._field(row, f) for f in self.FIELDS}
+
+    def rows(self, fields: Tuple[str, ...]) -> Iterator[Dict[str, Any]]:
+        """Toutes les entrées, dans l'ordre, réduites à fields"""
+        for row in range(len(self._ids)):
+            yield {f: self._field(row, f) for f in fields}
+
+    def files(self) -> List[str]:
+        """Fichiers ayant au moins une référence, dans l'ordre de l'index"""
+        return list(self._files.values)
+
+    def dated(self) -> Iterator[Tuple[int, str, int]]:
+        """(id, type, ordinal de la date ISO) des entrées datées"""
+        types = self._types.values
+        for row, day in enumerate(self._day):
+            if day:
+                yield self._ids[row], types[self._type[row]], day
+
+    def export(self) -> Tuple[Dict[str, array], Dict[str, List[Optional[str]]]]:
+        """Colonnes et tables de chaînes, pour l'écriture d'un fichier
+        d'index (mapped.write_index)"""
+        columns = {
+            "ids": self._ids, "type": self._type, "file": self._file, "text": self._text,
+            "norm": self._norm, "date": self._date, "day": self._day, "start": self._start,
+            "end": self._end, "sorted_ids": self._sorted_ids, "sorted_rows": self._sorted_rows,
+        }
+        tables = {
+            "types": self._types.values, "files": self._files.values,
+            "texts": self._texts.values, "dates": self._dates.values,
+        }
+        if self._snippets is not None:
+            tables["snippets"] = self._snippets
+        return columns, tables
+
+    def types(self) -> Iterator[Tuple[int, str]]:
+        """(id, type) de chaque entrée, dans l'ordre"""
+        values = self._types.values
+        return zip(self._ids, (values[t] for t in self._type))
@@ -0,0 +1,133 @@
+# dates.py
+"""
+Dates : reconnaissance des dates françaises, forme ISO et index trié.
+Exporte :
+ - find_date(text) -> (date telle qu'écrite, "AAAA-MM-JJ") ou None
+ - iso_date(text) -> "AAAA-MM-JJ" ou None
+ - doc_date(file) -> date ISO d'un document, lue dans son nom
+   ("2009-09-11_AP-auto_refonte_pixtral.html")
+ - parse_bound(value, end=False) -> ordinal d'une borne "AAAA", "AAAA-MM" ou "AAAA-MM-JJ"
+ - DateIndex : ordinaux triés, recherche d'un intervalle par dichotomie
+"""
+
+import re
+import unicodedata
+from calendar import monthrange
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+# Variantes rencontrées dans les textes OCR : accents absents ou mal
+# reconnus, "1 er", "1°", espaces multiples
+_MONTHS = (
+    ("janvier", r"janv[i1l]er"),
+    ("février", r"f[ée]vr[i1l]er"),
+    ("mars", r"mars"),
+    ("avril", r"avr[i1l]l"),
+    ("mai", r"mai"),
+    ("juin", r"ju[i1l]n"),
+    ("juillet", r"ju[i1l]llet"),
+    ("août", r"ao[uûù]t"),
+    ("septembre", r"septembre"),
+    ("octobre", r"octobre"),
+    ("novembre", r"novembre"),
+    ("décembre", r"d[ée]cembre"),
+)
+_MONTH_RE = [re.compile(rf"{pattern}$", re.IGNORECASE) for _, pattern in _MONTHS]
+
+DATE_RE = re.compile(
+    r"\b(1\s?er|1°|[0-3]?\d)\s+("
+    + "|".join(pattern for _, pattern in _MONTHS)
+    + r")\s+(\d{4})\b",
+    re.IGNORECASE,
+)
+_DOC_DATE_RE = re.compile(r"^(\d{4})-(\d{2})-(\d{2})(?:_|$)")
+
+
+def _month(name: str) -> int:
+    for n, reg in enumerate(_MONTH_RE, 1):
+        if reg.match(name):
+            return n
+    raise ValueError(name)
+
+
+def find_date(text: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Première date valide du texte : (telle qu'écrite, ISO)"""
+    if not text:
+        return None
+    # accents décomposés (e + accent combinant) fréquents dans les sources OCR
+    text = unicodedata.normalize("NFC", text)
+    for m in DATE_RE.finditer(text):
+        day = 1 if not m.group(1).isdigit() else int(m.group(1))
+        try:
+            d = date(int(m.group(3)), _month(m.group(2)), day)
+        except ValueError:
+            continue  # "31 février", "0 mars"…
+        return m.group(0), d.isoformat()
+    return None
+
+
+def iso_date(text: Optional[str]) -> Optional[str]:
+    found = find_date(text)
+    return found[1] if found else None
+
+
+def doc_date(file: str) -> Optional[str]:
+    m = _DOC_DATE_RE.match(Path(file).name)
+    if not m:
+        return None
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_bound(value: str, end: bool = False) -> int:
+    """Borne d'intervalle : "1977" = du 1er janvier (ou jusqu'au 31 décembre
+    si end) ; "1977-09", "1977-09-21" de même. ValueError si invalide."""
+    parts = value.split("-")
+    if not 1 <= len(parts) <= 3 or not all(p.isdigit() for p in parts):
+        raise ValueError(value)
+    year = int(parts[0])
+    if len(parts) == 3:
+        return date(year, int(parts[1]), int(parts[2])).toordinal()
+    if len(parts) == 2:
+        first = date(year, int(parts[1]), 1)
+        if not end:
+            return first.toordinal()
+        return first.toordinal() + monthrange(year, first.month)[1] - 1
+    return (date(year, 12, 31) if end else date(year, 1, 1)).toordinal()
+
+
+def ordinal(iso: Optional[str]) -> int:
+    """Ordinal d'une date ISO, 0 si absente"""
+    return date.fromisoformat(iso).toordinal() if iso else 0
+
+
+class DateIndex:
+    """
+    Clés (entiers, ID ou indices) triées par date : range() donne les
+    positions d'un intervalle par deux recherches dichotomiques, keys() les
+    seules clés d'une page, sans parcourir le reste.
+    """
+    __slots__ = ("_ords", "_keys")
+
+    def __init__(self, pairs: Iterable[Tuple[int, int]]):
+        """pairs : (ordinal de la date, clé) ; ordinal 0 = sans date, ignoré"""
+        ranked = sorted((o, k) for o, k in pairs if o)
+        self._ords = array("i", (o for o, _ in ranked))
+        self._keys = array("I", (k for _, k in ranked))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def range(self, lo: Optional[int] = None, hi: Optional[int] = None) -> Tuple[int, int]:
+        """Positions [i, j) des clés datées de lo à hi (bornes incluses)"""
+        i = 0 if lo is None else bisect_left(self._ords, lo)
+        j = len(self._ords) if hi is None else bisect_right(self._ords, hi)
+        return i, j
+
+    def keys(self, i: int, j: int) -> List[int]:
+        return list(self._keys[i:j])
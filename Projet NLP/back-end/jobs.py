@@ -0,0 +1,155 @@
+# jobs.py
+"""
+Tâches de fond pour les traitements longs (indexation, ZIP d'un dossier).
+Exporte :
+ - Job : état d'une tâche (fichiers traités / total, références, ETA…)
+ - JobManager(max_running, max_queued) : file bornée, exécution en threads
+ - JobCancelled, QueueFull
+
+Une tâche reçoit son Job et signale sa progression par job.start(total)
+puis job.advance(refs) après chaque fichier ; advance() lève JobCancelled
+si l'annulation a été demandée (prise en compte entre deux fichiers).
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+_FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.total: Optional[int] = None
+        self.done = 0
+        self.refs = 0
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.result: Any = None
+        self.artifact: Optional[Path] = None
+        self._cancel = threading.Event()
+
+    # ---------- appelé par la tâche ----------
+    def start(self, total: int):
+        self.total = total
+        self.check()
+
+    def advance(self, refs: int = 0):
+        self.done += 1
+        self.refs += refs
+        self.check()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    # ---------- état ----------
+    def eta(self) -> Optional[float]:
+        """Secondes restantes estimées, au rythme moyen des fichiers déjà traités"""
+        if self.status != RUNNING or not self.done or self.total is None:
+            return None
+        elapsed = time.time() - self.started
+        return round(elapsed / self.done * (self.total - self.done), 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "done": self.done,
+            "total": self.total,
+            "refs": self.refs,
+            "eta": self.eta(),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "result": self.result,
+            "download": self.artifact is not None and self.status == DONE,
+        }
+
+
+class JobManager:
+    """
+    Au plus max_running tâches en cours et max_queued en attente ; au-delà,
+    submit() lève QueueFull. Les keep_finished dernières tâches terminées
+    sont conservées (et leurs artefacts, supprimés ensuite).
+    """
+
+    def __init__(self, max_running: int = 1, max_queued: int = 8, keep_finished: int = 50):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.keep_finished = keep_finished
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="job")
+
+    def submit(self, kind: str, params: Dict[str, Any], func: Callable[[Job], Any]) -> Job:
+        job = Job(kind, params)
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status not in _FINISHED)
+            if pending >= self.max_running + self.max_queued:
+                raise QueueFull()
+            self._jobs[job.id] = job
+            self._prune()
+        self._pool.submit(self._run, job, func)
+        return job
+
+    def _run(self, job: Job, func: Callable[[Job], Any]):
+        if job._cancel.is_set():
+            job.status, job.finished = CANCELLED, time.time()
+            return
+        job.status, job.started = RUNNING, time.time()
+        try:
+            job.result = func(job)
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.status, job.error = FAILED, str(e)
+        finally:
+            job.finished = time.time()
+            if job.status != DONE and job.artifact is not None:
+                job.artifact.unlink(missing_ok=True)
+                job.artifact = None
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in _FINISHED]
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            if job.artifact is not None:
+                job.artifact.unlink(missing_ok=True)
+            del self._jobs[job.id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is not None and job.status not in _FINISHED:
+            job._cancel.set()
+            if job.status == QUEUED:
+                job.status, job.finished = CANCELLED, time.time()
+        return job
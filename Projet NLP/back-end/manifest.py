@@ -0,0 +1,134 @@
+# manifest.py
+"""
+Manifeste d'indexation incrémentale d'un dossier.
+Exporte :
+ - Manifest : pour chaque fichier, mtime, taille, empreinte du contenu et
+   ID des références produites, plus les entrées d'index elles-mêmes
+ - file_digest(path) -> empreinte sha256 du contenu
+ - default_manifest_path(input_dir, suffix) -> fichier voisin du dossier
+
+Un nouvel index n'annote que les fichiers nouveaux ou modifiés et retire
+les références des fichiers supprimés ; les ID des fichiers inchangés sont
+conservés, les nouveaux ID reprennent après le plus grand ID attribué.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from annotator import PATTERNS_VERSION
+
+MANIFEST_VERSION = 4
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def default_manifest_path(input_dir: Path, suffix: str = "_index.json") -> Path:
+    """À côté du dossier, comme le dossier <nom>_annotated"""
+    return input_dir.parent / (input_dir.name + suffix)
+
+
+class Manifest:
+    """
+    État persisté d'un index. key identifie ce qui a produit les entrées
+    (mode d'analyse, champs…) : si elle ou PATTERNS_VERSION diffère du
+    fichier chargé, le manifeste repart vide (reconstruction complète).
+    """
+
+    def __init__(self, path: Optional[Path], key: str):
+        self.path = path
+        self.key = key
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.items: Dict[int, Dict[str, Any]] = {}
+        self.next_id = 1
+
+    @classmethod
+    def load(cls, path: Path, key: str) -> "Manifest":
+        m = cls(path, key)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return m
+        if (data.get("version") != MANIFEST_VERSION or data.get("key") != key
+                or data.get("patterns") != PATTERNS_VERSION):
+            return m
+        m.files = data["files"]
+        m.items = {int(i): item for i, item in data["items"].items()}
+        m.next_id = data["next_id"]
+        return m
+
+    def save(self):
+        """Écriture atomique (fichier temporaire puis renommage)"""
+        data = {
+            "version": MANIFEST_VERSION,
+            "key": self.key,
+            "patterns": PATTERNS_VERSION,
+            "next_id": self.next_id,
+            "files": self.files,
+            "items": self.items,
+        }
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def diff(self, html_files: List[Path]) -> Tuple[List[Path], List[str]]:
+        """
+        (fichiers à annoter, chemins supprimés). Un fichier dont mtime et
+        taille sont inchangés n'est pas relu ; sinon son contenu est haché et
+        il n'est réannoté que si l'empreinte a changé.
+        """
+        changed = []
+        for f in html_files:
+            rec = self.files.get(str(f))
+            if rec is None:
+                changed.append(f)
+                continue
+            st = f.stat()
+            if rec["mtime"] == st.st_mtime_ns and rec["size"] == st.st_size:
+                continue
+            if rec["sha256"] == file_digest(f):
+                rec["mtime"], rec["size"] = st.st_mtime_ns, st.st_size
+                continue
+            changed.append(f)
+        present = {str(f) for f in html_files}
+        deleted = [p for p in self.files if p not in present]
+        return changed, deleted
+
+    def drop(self, path: str):
+        rec = self.files.pop(path, None)
+        if rec:
+            for i in rec["ids"]:
+                self.items.pop(i, None)
+
+    def add(self, f: Path, entries: List[Dict[str, Any]], digest: Optional[str] = None):
+        """Remplace les entrées de f ; attribue les ID à la suite. digest :
+        empreinte du contenu déjà calculée à la lecture (sinon f est relu)"""
+        self.drop(str(f))
+        st = f.stat()
+        ids = []
+        for e in entries:
+            self.items[self.next_id] = {"id": self.next_id, **e}
+            ids.append(self.next_id)
+            self.next_id += 1
+        self.files[str(f)] = {
+            "mtime": st.st_mtime_ns,
+            "size": st.st_size,
+            "sha256": digest or file_digest(f),
+            "ids": ids,
+        }
+
+    def entries(self, html_files: List[Path]) -> Iterator[Dict[str, Any]]:
+        """Entrées dans l'ordre des fichiers puis des ID"""
+        for f in html_files:
+            rec = self.files.get(str(f))
+            if rec:
+                for i in rec["ids"]:
+                    yield self.items[i]
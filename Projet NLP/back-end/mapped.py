@@ -0,0 +1,203 @@
+# mapped.py
+"""
+Fichier d'index binaire en lecture seule, projeté en mémoire (mmap) et
+partagé par tous les processus qui le lisent.
+Exporte :
+ - write_index(path, items, next_id, meta) : écrit l'index (CompactIndex)
+   dans un fichier temporaire puis le renomme à la place de path
+ - MappedIndex(path) : même interface que CompactIndex, lue dans le fichier
+   projeté ; postings() -> ID par type, meta, next_id, generation
+ - file_key(path) -> identité du fichier (inode, date, taille), None s'il
+   n'existe pas : un changement signale un nouvel index
+
+Les workers d'uvicorn / gunicorn projettent le même fichier : une seule
+copie des pages dans le cache du système, un chargement qui se réduit à
+lire l'en-tête, et la même vue de l'index pour tous. Le renommage est
+atomique : un worker qui lit encore l'ancien fichier le garde projeté
+jusqu'à ce qu'il passe au nouveau.
+
+Format (tableaux dans l'ordre d'octets de la machine, indiqué dans info) :
+en-tête (magie, version, nombre de sections, génération), table des
+sections (nom, type d'élément, position, nombre d'éléments), puis les
+sections alignées sur 8 octets : colonnes de CompactIndex, recherche par
+ID (ID triés et lignes), tables de chaînes (positions dans un pool UTF-8
+commun), postings par type et métadonnées JSON.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from compact import CompactIndex
+
+MAGIC = b"REFSIDX\x00"
+VERSION = 1
+_HEADER = struct.Struct("<8sIIQ")
+_SECTION = struct.Struct("<16sc7xQQ")
+_NONE = -1
+
+
+def file_key(path: Path) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _buckets(items: CompactIndex) -> Dict[str, List[int]]:
+    buckets: Dict[str, List[int]] = {}
+    for item_id, typ in items.types():
+        buckets.setdefault(typ or "Autres", []).append(item_id)
+    return buckets
+
+
+def write_index(path: Path, items: CompactIndex, next_id: int,
+                meta: Optional[Dict[str, str]] = None) -> int:
+    """Renvoie la génération écrite (horodatage en ns, repris par les
+    curseurs de pagination : identique dans tous les workers)"""
+    columns, tables = items.export()
+    buckets = _buckets(items)
+    tables = dict(tables, buckets=list(buckets))
+    sections: List[Tuple[str, str, bytes, int]] = []
+    for name, col in columns.items():
+        sections.append((name, col.typecode, col.tobytes(), len(col)))
+
+    pool = bytearray()
+    none: Dict[str, int] = {}
+    for name, values in tables.items():
+        offsets = array("Q", [len(pool)])
+        none[name] = _NONE
+        for k, value in enumerate(values):
+            if value is None:
+                none[name] = k
+            else:
+                pool += value.encode("utf-8")
+            offsets.append(len(pool))
+        sections.append((name + ".off", "Q", offsets.tobytes(), len(offsets)))
+    sections.append(("pool", "B", bytes(pool), len(pool)))
+
+    counts = array("I", (len(ids) for ids in buckets.values()))
+    postings = array("I", (i for ids in buckets.values() for i in ids))
+    sections.append(("bucket_counts", "I", counts.tobytes(), len(counts)))
+    sections.append(("postings", "I", postings.tobytes(), len(postings)))
+
+    generation = time.time_ns()
+    info = {"byteorder": sys.byteorder, "meta": dict(meta or {}), "next_id": next_id,
+            "none": none, "snippets": "snippets" in tables}
+    raw = json.dumps(info, ensure_ascii=False).encode("utf-8")
+    sections.append(("info", "B", raw, len(raw)))
+
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    pos = _HEADER.size + _SECTION.size * len(sections)
+    table, placed = [], []
+    for name, code, data, count in sections:
+        pos += -pos % 8
+        table.append(_SECTION.pack(name.encode("ascii"), code.encode("ascii"), pos, count))
+        placed.append((pos, data))
+        pos += len(data)
+    try:
+        with open(tmp, "wb") as fh:
+            fh.write(_HEADER.pack(MAGIC, VERSION, len(sections), generation))
+            fh.write(b"".join(table))
+            for offset, data in placed:
+                fh.write(b"\0" * (offset - fh.tell()))
+                fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    return generation
+
+
+class _Pooled:
+    """Table de chaînes lue dans le pool : décodée à la demande"""
+    __slots__ = ("_offsets", "_pool", "_none")
+
+    def __init__(self, offsets: memoryview, pool: memoryview, none: int):
+        self._offsets = offsets
+        self._pool = pool
+        self._none = none
+
+    @property
+    def values(self) -> "_Pooled":
+        # même accès que _Strings.values dans CompactIndex
+        return self
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, k: int) -> Optional[str]:
+        if k == self._none:
+            return None
+        return str(self._pool[self._offsets[k]:self._offsets[k + 1]], "utf-8")
+
+    def __iter__(self):
+        return (self[k] for k in range(len(self)))
+
+
+class MappedIndex(CompactIndex):
+    """
+    CompactIndex dont les colonnes sont des vues sur le fichier projeté :
+    rien n'est copié au chargement. ValueError si le fichier n'est pas un
+    index de ce format (ou d'une machine d'un autre ordre d'octets).
+    """
+
+    __slots__ = ("_mm", "_postings", "meta", "next_id", "generation")
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if len(mm) < _HEADER.size:
+            raise ValueError(f"Index projeté invalide : {path}")
+        magic, version, count, generation = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Index projeté invalide ou d'une autre version : {path}")
+        view = memoryview(mm)
+        sections: Dict[str, memoryview] = {}
+        for k in range(count):
+            name, code, offset, n = _SECTION.unpack_from(mm, _HEADER.size + k * _SECTION.size)
+            code = code.decode("ascii")
+            size = array(code).itemsize
+            sections[name.rstrip(b"\0").decode("ascii")] = view[offset:offset + n * size].cast(code)
+        info = json.loads(str(sections["info"], "utf-8"))
+        if info["byteorder"] != sys.byteorder:
+            raise ValueError(f"Index projeté écrit sur une machine d'un autre ordre d'octets : {path}")
+
+        pool, none = sections["pool"], info["none"]
+
+        def table(name: str) -> _Pooled:
+            return _Pooled(sections[name + ".off"], pool, none[name])
+
+        self._ids, self._type, self._file = sections["ids"], sections["type"], sections["file"]
+        self._text, self._norm, self._date = sections["text"], sections["norm"], sections["date"]
+        self._day, self._start, self._end = sections["day"], sections["start"], sections["end"]
+        self._sorted_ids, self._sorted_rows = sections["sorted_ids"], sections["sorted_rows"]
+        self._types, self._files, self._texts, self._dates = (
+            table("types"), table("files"), table("texts"), table("dates"))
+        self._snippets = table("snippets") if info["snippets"] else None
+
+        names, counts, postings = table("buckets"), sections["bucket_counts"], sections["postings"]
+        self._postings: Dict[str, memoryview] = {}
+        pos = 0
+        for k, n in enumerate(counts):
+            self._postings[names[k]] = postings[pos:pos + n]
+            pos += n
+        self.meta: Dict[str, str] = info["meta"]
+        self.next_id: int = info["next_id"]
+        self.generation: int = generation
+
+    def postings(self) -> Dict[str, memoryview]:
+        """Type -> ID dans l'ordre de l'index (les « buckets » de l'instantané)"""
+        return self._postings
@@ -0,0 +1,153 @@
+# offload.py
+"""
+Annotation interactive hors du processus de l'API : pool de processus
+démarré d'avance et contrôle d'admission.
+Exporte :
+ - annotation_body(html, mode, budget, with_stats) -> (corps JSON, stats, types)
+ - Offloader(workers, max_queued) : run(func, *args) dans le pool ; au plus
+   workers appels en cours, max_queued en attente d'un processus libre
+ - Overloaded : file d'attente pleine (l'API répond 503 + Retry-After)
+ - SizeLimit : middleware ASGI, 413 dès l'en-tête Content-Length
+
+Annoter un gros document garde le GIL : dans le pool de threads de
+Starlette, il ralentit toutes les autres requêtes, /health compris, et les
+gros documents s'annotent les uns après les autres sur un seul cœur. Dans
+un processus fils, le parent ne fait plus que recevoir le corps JSON déjà
+sérialisé. Un document court reste annoté sur place : l'aller-retour vers
+le processus coûterait plus que l'annotation elle-même.
+"""
+
+import asyncio
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from annotator import annotate_html
+
+logger = logging.getLogger("juridic-annotator")
+
+
+class Overloaded(Exception):
+    pass
+
+
+def annotation_body(html: str, mode: str, budget: Optional[float],
+                    with_stats: bool) -> Tuple[bytes, Dict[str, Any], List[str]]:
+    """Corps JSON de /annotate ({"html", "references"[, "stats"][, "partial"]}),
+    stats de l'annotation et types des références (métriques, côté parent)"""
+    st: Dict[str, Any] = {}
+    annotated, refs = annotate_html(html, stats=st, mode=mode, budget=budget)
+    out: Dict[str, Any] = {"html": annotated, "references": refs}
+    if with_stats:
+        out["stats"] = st
+    if st.get("partial"):
+        out["partial"] = True
+    body = json.dumps(out, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return body, st, [r["type"] for r in refs]
+
+
+def _warm() -> None:
+    # premier appel dans le processus fils : préfiltre et expressions compilés
+    annotate_html("<p>Vu le décret n° 77-1133 du 21 septembre 1977</p>")
+
+
+class Offloader:
+    """
+    Pool de workers processus. run() attend un processus libre si les
+    workers sont occupés et qu'il reste de la place dans la file (max_queued),
+    lève Overloaded sinon, sans attendre. Un appel dont le client est parti
+    garde sa place jusqu'à ce que son processus ait fini : running reflète
+    toujours la charge réelle du pool.
+    S'utilise depuis la boucle d'événements seulement (compteurs sans verrou).
+    """
+
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.running = 0
+        self.waiting = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        """Crée le pool et attend que chaque processus ait annoté un premier
+        document (au démarrage de l'API : aucune requête ne paie ce coût)"""
+        if self.workers <= 0 or self._pool is not None:
+            return
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        for future in [self._pool.submit(_warm) for _ in range(self.workers)]:
+            future.result()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _release(self):
+        self.running -= 1
+        self._slots.release()
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """func : fonction de module (picklable). BrokenProcessPool si un
+        processus fils meurt en cours de route (le pool est alors recréé)"""
+        if self.running + self.waiting >= self.workers + self.max_queued:
+            raise Overloaded()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.running += 1
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            future = pool.submit(func, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+        try:
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            if self._pool is pool:
+                logger.error("❌ Processus d'annotation interrompu, pool recréé")
+                pool.shutdown(wait=False)
+                self._pool = None
+            raise
+
+
+class SizeLimit:
+    """
+    Répond 413 à une requête dont l'en-tête Content-Length dépasse la limite
+    de sa route, avant d'en lire le corps. limits : chemin -> octets ;
+    rejected : compteur (étiquette reason="too_large"). Un corps sans
+    Content-Length (chunked) est vérifié par la route elle-même.
+    """
+
+    def __init__(self, app, limits: Dict[str, int], rejected: Any = None):
+        self.app = app
+        self.limits = limits
+        self.rejected = rejected
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit:
+            length = next((value for name, value in scope.get("headers", ()) if name == b"content-length"), b"")
+            if length.isdigit() and int(length) > limit:
+                if self.rejected is not None:
+                    self.rejected.inc(reason="too_large")
+                body = json.dumps({"detail": f"Requête trop volumineuse (> {limit} octets)"},
+                                  ensure_ascii=False).encode("utf-8")
+                await send({"type": "http.response.start", "status": 413, "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                ]})
+                await send({"type": "http.response.body", "body": body})
+                return
+        await self.app(scope, receive, send)
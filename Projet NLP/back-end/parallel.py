@@ -0,0 +1,60 @@
+# parallel.py
+"""
+Exécution parallèle des traitements de corpus (pool de processus).
+Exporte :
+ - ordered_map(func, items, workers=1, chunksize=None) -> résultats dans l'ordre de items
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+
+def _run_chunk(func: Callable[[Any], Any], chunk: List[Any]) -> List[Any]:
+    """Exécuté dans un processus fils : traite un lot complet"""
+    return [func(item) for item in chunk]
+
+
+def default_workers() -> int:
+    """Nombre de processus par défaut : un par cœur"""
+    return os.cpu_count() or 1
+
+
+def ordered_map(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    workers: int = 1,
+    chunksize: Optional[int] = None,
+) -> Iterator[Any]:
+    """
+    Applique func à chaque élément et renvoie les résultats DANS L'ORDRE des
+    éléments, quel que soit l'ordre de fin des processus (les identifiants
+    attribués ensuite restent donc stables d'une exécution à l'autre).
+
+    workers <= 1 : exécution séquentielle dans le processus courant.
+    Sinon les éléments sont envoyés par lots de chunksize à un pool de
+    processus ; au plus 2 lots par processus sont en vol, pour borner la
+    mémoire occupée par les résultats en attente.
+    func doit être une fonction de module (picklable).
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    workers = min(workers, len(items))
+    if chunksize is None:
+        # ~4 lots par processus : équilibre la charge sans multiplier l'IPC
+        chunksize = max(1, min(32, len(items) // (workers * 4)))
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        next_chunk = 0
+        while next_chunk < len(chunks) or pending:
+            while next_chunk < len(chunks) and len(pending) < 2 * workers:
+                pending.append(pool.submit(_run_chunk, func, chunks[next_chunk]))
+                next_chunk += 1
+            yield from pending.popleft().result()
@@ -0,0 +1,322 @@
+# pipeline.py
+"""
+Traitement d'un corpus en une seule passe, commun à api.py et batch.py.
+Exporte :
+ - html_files(input_dir) -> fichiers HTML du dossier, triés
+ - index_entries(raw, refs, file) -> entrées d'index (sans ID) d'un document
+ - Document : un fichier traité (HTML annoté, références, entrées, stats)
+ - Pipeline(input_dir, sinks, ...) : lit, annote et distribue chaque fichier
+ - IndexSink, ZipSink, JsonlSink, StatsSink : sorties
+
+Chaque fichier est lu et annoté une fois, quel que soit le nombre de
+sorties. Une sortie déclare ce dont elle a besoin (needs : "html",
+"entries") et les fichiers qu'elle veut (wants()) : un fichier qu'aucune
+sortie ne veut n'est pas lu (fichiers inchangés d'un index incrémental
+seul), et les processus fils ne calculent ni ne renvoient ce que personne
+n'utilise (pas de HTML annoté sans ZipSink, pas d'entrées sans IndexSink).
+
+Une sortie : name, needs, begin(files), wants(file), add(doc), close()
+-> résumé (dict) ; passive : ne demande aucun fichier, reçoit ceux que les
+autres sorties font traiter (StatsSink).
+"""
+
+import hashlib
+import json
+from collections import Counter
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set
+
+from annotator import annotate_html, DEFAULT_MODE
+from compact import make_snippet
+from dates import find_date
+from manifest import Manifest
+from parallel import ordered_map
+from refsjson import DEFAULT_REFS_FORMAT, dump_refs
+from zipstream import ZipWriter, html_entry
+
+
+def html_files(input_dir: Path) -> List[Path]:
+    """Fichiers HTML d'un dossier, triés pour que les ID soient stables"""
+    return sorted(p for p in input_dir.rglob("*.html") if html_entry(p.as_posix()))
+
+
+def index_entries(raw: str, refs: List[Dict[str, Any]], file: str) -> List[Dict[str, Any]]:
+    """Entrées d'index (sans ID) des références d'un document ; file : son chemin"""
+    entries = []
+    for r in refs:
+        start, end = r["start"], r["end"]
+        normalized = r.get("normalized", r["text"])
+        found = find_date(r["text"]) or (normalized != r["text"] and find_date(normalized)) or None
+        entries.append({
+            "type": r["type"],
+            "text": r["text"],
+            "normalized": normalized,
+            "file": file,
+            "date": found[0] if found else None,
+            "date_iso": found[1] if found else None,
+            "snippet": make_snippet(raw, start, end),
+            "href": r.get("href", ""),
+            "start": start,
+            "end": end,
+        })
+    return entries
+
+
+class Document:
+    """annotated / entries : None si aucune sortie ne les demande ; digest :
+    empreinte sha256 du fichier lu (reprise par le manifeste)"""
+
+    __slots__ = ("file", "annotated", "refs", "entries", "stats", "digest")
+
+    def __init__(self, file: Path, annotated: Optional[str], refs: List[Dict[str, Any]],
+                 entries: Optional[List[Dict[str, Any]]], stats: Dict[str, Any], digest: str):
+        self.file = file
+        self.annotated = annotated
+        self.refs = refs
+        self.entries = entries
+        self.stats = stats
+        self.digest = digest
+
+
+def _decode(data: bytes) -> str:
+    # comme read_text(encoding="utf-8", errors="ignore") : fins de ligne universelles
+    text = data.decode("utf-8", errors="ignore")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def process_file(f: Path, mode: str = DEFAULT_MODE, budget: Optional[float] = None,
+                 html: bool = True, entries: bool = False) -> Document:
+    """Lit et annote un fichier (exécuté dans un processus fils en mode parallèle)"""
+    stats: Dict[str, Any] = {}
+    t0 = perf_counter()
+    data = f.read_bytes()
+    raw = _decode(data)
+    stats["read_seconds"] = round(perf_counter() - t0, 6)
+    annotated, refs = annotate_html(raw, stats=stats, mode=mode, budget=budget)
+    return Document(
+        f, annotated if html else None, refs,
+        index_entries(raw, refs, str(f)) if entries else None,
+        stats, hashlib.sha256(data).hexdigest(),
+    )
+
+
+class Pipeline:
+    """
+    Itérer sur le pipeline traite les fichiers dans l'ordre (workers > 1 :
+    pool de processus, voir parallel.ordered_map) et rend chaque Document
+    une fois remis aux sorties ; close() ferme les sorties et renvoie leurs
+    résumés par nom. run() fait les deux.
+    on_document(doc) : appelé avant les sorties (métriques, avertissements) ;
+    progress : objet start(total) / advance(refs), comme jobs.Job (une
+    annulation y lève son exception entre deux fichiers).
+    """
+
+    def __init__(self, input_dir: Path, sinks: Sequence[Any], mode: str = DEFAULT_MODE,
+                 workers: int = 1, budget: Optional[float] = None,
+                 on_document: Optional[Callable[[Document], None]] = None,
+                 progress: Any = None):
+        self.input_dir = input_dir
+        self.sinks = list(sinks)
+        self.mode = mode
+        self.workers = workers
+        self.budget = budget
+        self.on_document = on_document
+        self.progress = progress
+        self.files = html_files(input_dir)
+
+    def __iter__(self) -> Iterator[Document]:
+        for sink in self.sinks:
+            sink.begin(self.files)
+        active = [sink for sink in self.sinks if not sink.passive] or self.sinks
+        todo = [f for f in self.files if any(sink.wants(f) for sink in active)]
+        needs: Set[str] = set()
+        for sink in self.sinks:
+            needs |= sink.needs
+        work = partial(process_file, mode=self.mode, budget=self.budget,
+                       html="html" in needs, entries="entries" in needs)
+        if self.progress is not None:
+            self.progress.start(len(todo))
+        for doc in ordered_map(work, todo, self.workers):
+            if self.on_document is not None:
+                self.on_document(doc)
+            for sink in self.sinks:
+                if sink.wants(doc.file):
+                    sink.add(doc)
+            if self.progress is not None:
+                self.progress.advance(len(doc.refs))
+            yield doc
+
+    def close(self) -> Dict[str, Any]:
+        return {sink.name: sink.close() for sink in self.sinks}
+
+    def run(self) -> Dict[str, Any]:
+        for _ in self:
+            pass
+        return self.close()
+
+
+class _Sink:
+    name = ""
+    needs: Set[str] = set()
+    passive = False
+
+    def begin(self, files: List[Path]):
+        pass
+
+    def wants(self, f: Path) -> bool:
+        return True
+
+    def add(self, doc: Document):
+        raise NotImplementedError
+
+    def close(self) -> Dict[str, Any]:
+        return {}
+
+
+class IndexSink(_Sink):
+    """
+    Entrées d'index dans le manifeste (ID attribués à la suite). Seuls les
+    fichiers nouveaux ou modifiés depuis le manifeste sont voulus ; les
+    fichiers supprimés en sont retirés dès begin(). changed / deleted
+    restent disponibles après close() (mise à jour de l'index SQLite).
+    """
+
+    name = "index"
+    needs = {"entries"}
+
+    def __init__(self, manifest: Manifest):
+        self.manifest = manifest
+        self.files: List[Path] = []
+        self.changed: List[Path] = []
+        self.deleted: List[str] = []
+        self._wanted: Set[Path] = set()
+
+    def begin(self, files: List[Path]):
+        self.files = files
+        self.changed, self.deleted = self.manifest.diff(files)
+        for path in self.deleted:
+            self.manifest.drop(path)
+        self._wanted = set(self.changed)
+
+    def wants(self, f: Path) -> bool:
+        return f in self._wanted
+
+    def add(self, doc: Document):
+        self.manifest.add(doc.file, doc.entries, digest=doc.digest)
+
+    def entries(self) -> Iterator[Dict[str, Any]]:
+        """Toutes les entrées, dans l'ordre des fichiers"""
+        return self.manifest.entries(self.files)
+
+    def close(self) -> Dict[str, Any]:
+        return {
+            "annotated": len(self.changed),
+            "removed": len(self.deleted),
+            "unchanged": len(self.files) - len(self.changed),
+        }
+
+
+class ZipSink(_Sink):
+    """
+    Archive annotée : <fichier>_annotated.html et <fichier>_refs.json par
+    document, chemins relatifs à root. out : flux binaire où écrire ; sans
+    out, les octets produits s'accumulent jusqu'au prochain take() (réponse
+    HTTP en flux). stats : voir zipstream.ZipWriter.
+    """
+
+    name = "zip"
+    needs = {"html"}
+
+    def __init__(self, root: Path, out: Any = None, refs_format: str = DEFAULT_REFS_FORMAT,
+                 stats: Optional[Dict[str, float]] = None):
+        self.root = root
+        self.out = out
+        self.refs_format = refs_format
+        self.stats = stats if stats is not None else {}
+        self._writer = ZipWriter(stats=self.stats)
+        self._pending: List[bytes] = []
+        self.documents = 0
+
+    def _emit(self, data: bytes):
+        if not data:
+            return
+        if self.out is not None:
+            self.out.write(data)
+        else:
+            self._pending.append(data)
+
+    def add(self, doc: Document):
+        rel_dir = doc.file.relative_to(self.root).parent
+        self._emit(self._writer.add((rel_dir / (doc.file.stem + "_annotated.html")).as_posix(), doc.annotated))
+        self._emit(self._writer.add((rel_dir / (doc.file.stem + "_refs.json")).as_posix(),
+                                    dump_refs(doc.refs, self.refs_format)))
+        self.documents += 1
+
+    def take(self) -> bytes:
+        data = b"".join(self._pending)
+        self._pending.clear()
+        return data
+
+    def close(self) -> Dict[str, Any]:
+        # répertoire central, écrit à la fermeture
+        self._emit(self._writer.close())
+        return {"documents": self.documents, "bytes": self.stats.get("bytes", 0)}
+
+
+class JsonlSink(_Sink):
+    """Une ligne JSON par référence : {"file": ..., start, end, type, text,
+    normalized, href}. out : flux texte"""
+
+    name = "jsonl"
+
+    def __init__(self, out: Any):
+        self.out = out
+        self.references = 0
+
+    def add(self, doc: Document):
+        file = str(doc.file)
+        lines = [json.dumps({"file": file, **r}, ensure_ascii=False) for r in doc.refs]
+        if lines:
+            self.out.write("\n".join(lines) + "\n")
+        self.references += len(lines)
+
+    def close(self) -> Dict[str, Any]:
+        return {"references": self.references}
+
+
+class StatsSink(_Sink):
+    """Totaux du corpus : documents, références par type, octets parcourus,
+    analyses partielles, temps cumulé par étape"""
+
+    name = "stats"
+    passive = True
+    _STAGES = ("read", "scan", "resolve", "render")
+
+    def __init__(self):
+        self.documents = 0
+        self.partial = 0
+        self.bytes_scanned = 0
+        self.types: Counter = Counter()
+        self.seconds = {stage: 0.0 for stage in self._STAGES}
+
+    def add(self, doc: Document):
+        self.documents += 1
+        self.partial += bool(doc.stats.get("partial"))
+        self.bytes_scanned += doc.stats.get("bytes_scanned", 0)
+        self.types.update(r["type"] for r in doc.refs)
+        for stage in self._STAGES:
+            self.seconds[stage] += doc.stats.get(f"{stage}_seconds") or 0.0
+
+    def close(self) -> Dict[str, Any]:
+        return {
+            "documents": self.documents,
+            "references": sum(self.types.values()),
+            "types": dict(self.types.most_common()),
+            "bytes_scanned": self.bytes_scanned,
+            "partial": self.partial,
+            "seconds": {stage: round(s, 6) for stage, s in self.seconds.items()},
+        }
@@ -0,0 +1,72 @@
+# refsjson.py
+"""
+Sérialisation des fichiers <document>_refs.json.
+Exporte :
+ - REFS_FORMATS / DEFAULT_REFS_FORMAT : "json" (liste d'objets indentée,
+   format historique) ou "compact" (colonnes : noms des champs une fois,
+   une ligne de valeurs par référence)
+ - dump_refs(refs, fmt) -> texte du fichier
+ - load_refs(text) -> liste de références (dicts), quel que soit le format
+
+"json" produit exactement le texte de json.dumps(refs, ensure_ascii=False,
+indent=2), mais sans l'encodeur Python pur qu'impose indent : chaque valeur
+est écrite par l'encodeur C de chaînes. "compact" est écrit d'un bloc par
+l'encodeur C et pèse environ moitié moins (pas de clés répétées).
+"""
+
+import json
+from json.encoder import encode_basestring
+from typing import Any, Dict, List
+
+REFS_FORMATS = ("json", "compact")
+DEFAULT_REFS_FORMAT = "json"
+
+
+def _value(v: Any) -> str:
+    if v.__class__ is str:
+        return encode_basestring(v)
+    if v.__class__ is int:
+        return int.__repr__(v)
+    if v is None:
+        return "null"
+    return json.dumps(v, ensure_ascii=False)
+
+
+def _indented(refs: List[Dict[str, Any]]) -> str:
+    if not refs:
+        return "[]"
+    scalars = (str, int, type(None))
+    if any(v.__class__ not in scalars for r in refs for v in r.values()):
+        # valeur imbriquée : l'indentation demande l'encodeur complet
+        return json.dumps(refs, ensure_ascii=False, indent=2)
+    objects = []
+    for r in refs:
+        if not r:
+            objects.append("{}")
+            continue
+        objects.append("{\n    " + ",\n    ".join(
+            encode_basestring(k) + ": " + _value(v) for k, v in r.items()
+        ) + "\n  }")
+    return "[\n  " + ",\n  ".join(objects) + "\n]"
+
+
+def _columns(refs: List[Dict[str, Any]]) -> str:
+    names = list(dict.fromkeys(k for r in refs for k in r))
+    rows = [[r.get(f) for f in names] for r in refs]
+    return json.dumps({"fields": names, "refs": rows}, ensure_ascii=False, separators=(",", ":"))
+
+
+def dump_refs(refs: List[Dict[str, Any]], fmt: str = DEFAULT_REFS_FORMAT) -> str:
+    if fmt == "json":
+        return _indented(refs)
+    if fmt == "compact":
+        return _columns(refs)
+    raise ValueError(f"Format inconnu: {fmt!r} (attendu: {', '.join(REFS_FORMATS)})")
+
+
+def load_refs(text: str) -> List[Dict[str, Any]]:
+    data = json.loads(text)
+    if isinstance(data, dict):
+        names = data["fields"]
+        return [dict(zip(names, row)) for row in data["refs"]]
+    return data
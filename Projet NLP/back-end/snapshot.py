@@ -0,0 +1,166 @@
+# snapshot.py
+"""
+Index en mémoire : instantanés immuables, publiés par nom de corpus.
+Exporte :
+ - IndexSnapshot(items, next_id, ...) : un index (CompactIndex ou
+   MappedIndex) et ses vues (types, citations, dates), jamais modifié une
+   fois construit
+ - Corpora : instantané courant de chaque corpus ; publish() le remplace
+   d'une seule affectation, get() le lit sans verrou
+ - corpus_name_ok(name) : nom de corpus utilisable (fichiers, URL)
+
+Une reconstruction prépare le nouvel instantané à côté de l'ancien, qui
+continue de servir les lectures ; une requête lit l'instantané une fois et
+n'utilise que lui, elle ne voit donc jamais un index à moitié construit.
+"""
+
+import itertools
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from citations import CitationGraph, folder_of
+from compact import CompactIndex
+from dates import DateIndex, doc_date, ordinal
+
+_CORPUS_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+
+# numéro de génération unique à tous les corpus : un curseur de pagination
+# d'un instantané n'est valable pour aucun autre
+_GENERATIONS = itertools.count(1)
+
+
+def corpus_name_ok(name: str) -> bool:
+    return _CORPUS_NAME.fullmatch(name) is not None
+
+
+def _date_indexes(items: CompactIndex):
+    """Index des dates, construits une fois par index : une requête par
+    intervalle n'est ensuite que deux recherches dichotomiques"""
+    dated = list(items.dated())
+    refs: Dict[Optional[str], DateIndex] = {None: DateIndex((day, i) for i, _, day in dated)}
+    by_type: Dict[str, List[Tuple[int, int]]] = {}
+    for i, typ, day in dated:
+        by_type.setdefault(typ or "Autres", []).append((day, i))
+    refs.update((typ, DateIndex(pairs)) for typ, pairs in by_type.items())
+
+    files = items.files()
+    docs = [(ordinal(doc_date(f)), k) for k, f in enumerate(files)]
+    by_folder: Dict[str, List[Tuple[int, int]]] = {}
+    for day, k in docs:
+        by_folder.setdefault(folder_of(files[k]), []).append((day, k))
+    doc_index: Dict[Optional[str], DateIndex] = {None: DateIndex(docs)}
+    doc_index.update((folder, DateIndex(pairs)) for folder, pairs in by_folder.items())
+    return refs, doc_index, files
+
+
+class IndexSnapshot:
+    """
+    items : entrées en colonnes ; buckets : type -> ID dans l'ordre de
+    l'index (fournis par un index projeté, sinon calculés), bucket_starts :
+    position du premier élément de chaque type, tous types à la suite ;
+    citations ; ref_dates / doc_dates : index triés par date (références
+    toutes / par type, documents tous / par dossier), doc_files. Citations
+    et dates sont construites au premier accès : /item ou /tree n'attendent
+    pas un calcul dont ils n'ont pas besoin.
+    meta : source et clé de l'index (comme dans RefStore) ; gen : génération
+    imposée (celle d'un index projeté, commune à tous les workers).
+    """
+
+    __slots__ = (
+        "items", "buckets", "bucket_starts", "next_id", "gen", "meta", "built_at",
+        "_citations", "_dates", "_lock",
+    )
+
+    def __init__(self, items: CompactIndex, next_id: int, meta: Optional[Dict[str, str]] = None,
+                 buckets: Optional[Dict[str, Sequence[int]]] = None, gen: Optional[int] = None):
+        if buckets is None:
+            buckets = {}
+            for item_id, typ in items.types():
+                buckets.setdefault(typ or "Autres", []).append(item_id)
+        starts, n = [], 0
+        for ids in buckets.values():
+            starts.append(n)
+            n += len(ids)
+        self.items = items
+        self.buckets = buckets
+        self.bucket_starts = starts
+        self.next_id = next_id
+        self.meta = dict(meta or {})
+        self.gen = gen if gen is not None else next(_GENERATIONS)
+        self.built_at = time.time()
+        self._citations: Optional[CitationGraph] = None
+        self._dates = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Dict[str, Any]], next_id: int,
+                     meta: Optional[Dict[str, str]] = None, snippets: bool = False) -> "IndexSnapshot":
+        return cls(CompactIndex(entries, snippets=snippets), next_id, meta)
+
+    @property
+    def citations(self) -> CitationGraph:
+        if self._citations is None:
+            with self._lock:
+                if self._citations is None:
+                    self._citations = CitationGraph(self.items.rows(("type", "text", "normalized", "file")))
+        return self._citations
+
+    def _date_views(self):
+        if self._dates is None:
+            with self._lock:
+                if self._dates is None:
+                    self._dates = _date_indexes(self.items)
+        return self._dates
+
+    @property
+    def ref_dates(self) -> Dict[Optional[str], DateIndex]:
+        return self._date_views()[0]
+
+    @property
+    def doc_dates(self) -> Dict[Optional[str], DateIndex]:
+        return self._date_views()[1]
+
+    @property
+    def doc_files(self) -> List[str]:
+        return self._date_views()[2]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": len(self.items),
+            "files": len(self.items.files()),
+            "types": {typ: len(ids) for typ, ids in self.buckets.items()},
+            "source": self.meta.get("source"),
+            "generation": self.gen,
+            "built_at": round(self.built_at, 3),
+        }
+
+
+class Corpora:
+    """
+    Nom -> instantané courant. Le dict est remplacé (copie) à chaque
+    publication, jamais modifié : get() et names() n'ont besoin d'aucun
+    verrou, une lecture concurrente d'une publication voit l'ancien ou le
+    nouvel instantané, jamais un état intermédiaire. Seules les
+    publications sont sérialisées.
+    """
+
+    def __init__(self):
+        self._snapshots: Dict[str, IndexSnapshot] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[IndexSnapshot]:
+        return self._snapshots.get(name)
+
+    def publish(self, name: str, snapshot: IndexSnapshot):
+        with self._lock:
+            snapshots = dict(self._snapshots)
+            snapshots[name] = snapshot
+            self._snapshots = snapshots
+
+    def names(self) -> List[str]:
+        return sorted(self._snapshots)
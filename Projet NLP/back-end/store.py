@@ -0,0 +1,181 @@
+# store.py
+"""
+Stockage persistant de l'index des références (SQLite).
+Exporte :
+ - RefStore(path) : table refs indexée (type, normalized, file, folder, date)
+   + table FTS5 sur text / normalized / snippet
+
+Les requêtes sont paginées par clé (id > after ORDER BY id) : chaque page
+est une recherche dans un index, quelle que soit sa position.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dates import iso_date
+
+# Incrémenté à chaque changement de schéma : une base plus ancienne est recréée
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS refs (
+    id INTEGER PRIMARY KEY,
+    type TEXT NOT NULL,
+    text TEXT NOT NULL,
+    normalized TEXT,
+    file TEXT NOT NULL,
+    folder TEXT,
+    date TEXT,
+    date_iso TEXT,
+    snippet TEXT,
+    href TEXT,
+    start INTEGER,
+    end INTEGER
+);
+CREATE INDEX IF NOT EXISTS refs_type ON refs (type, id);
+CREATE INDEX IF NOT EXISTS refs_normalized ON refs (normalized, id);
+CREATE INDEX IF NOT EXISTS refs_file ON refs (file, id);
+CREATE INDEX IF NOT EXISTS refs_folder ON refs (folder, id);
+CREATE INDEX IF NOT EXISTS refs_date ON refs (date_iso, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS refs_fts USING fts5 (
+    text, normalized, snippet,
+    content='refs', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+"""
+
+_COLUMNS = ("id", "type", "text", "normalized", "file", "folder", "date", "date_iso", "snippet", "href", "start", "end")
+# Champs renvoyés : ceux d'une entrée de l'index en mémoire
+_ITEM_FIELDS = ("id", "type", "text", "normalized", "file", "date", "date_iso", "snippet", "href")
+
+
+def _row(item: Dict[str, Any]) -> Tuple:
+    date = item.get("date")
+    return (
+        item["id"], item["type"], item["text"], item.get("normalized"), item["file"],
+        Path(item["file"]).parent.name,  # dossier d'installation : data/<id>/fichier.html
+        date, item.get("date_iso") or iso_date(date or item["text"]), item.get("snippet"), item.get("href"),
+        item.get("start"), item.get("end"),
+    )
+
+
+def _fts_query(q: str) -> str:
+    """Chaque mot devient une phrase FTS5 (les "-", "°"… ne sont pas des opérateurs)"""
+    return " ".join('"' + w.replace('"', '""') + '"' for w in q.split())
+
+
+class RefStore:
+    """Une connexion par thread (les routes synchrones de FastAPI tournent
+    dans un pool de threads) ; les écritures sont sérialisées."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._conn() as c:
+            if c.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                c.executescript("DROP TABLE IF EXISTS refs_fts; DROP TABLE IF EXISTS refs; DROP TABLE IF EXISTS meta;")
+            c.executescript(_SCHEMA)
+            c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path))
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- écriture ----------
+    def replace(self, items: Iterable[Dict[str, Any]], meta: Dict[str, str]):
+        """Remplace tout le contenu en une transaction"""
+        with self._write_lock, self._conn() as c:
+            c.execute("DELETE FROM refs")
+            self._insert(c, map(_row, items), meta)
+            # tout le corpus a changé : l'index plein texte est reconstruit d'un coup
+            c.execute("INSERT INTO refs_fts (refs_fts) VALUES ('rebuild')")
+
+    def update_files(self, files: Iterable[str], items: Iterable[Dict[str, Any]], meta: Dict[str, str]):
+        """Retire les références des fichiers donnés puis insère items ;
+        l'index plein texte n'est mis à jour que pour ces lignes"""
+        with self._write_lock, self._conn() as c:
+            for f in files:
+                # table FTS à contenu externe : retirer les lignes avant qu'elles disparaissent de refs
+                c.execute(
+                    "INSERT INTO refs_fts (refs_fts, rowid, text, normalized, snippet) "
+                    "SELECT 'delete', id, text, normalized, snippet FROM refs WHERE file = ?", (f,))
+                c.execute("DELETE FROM refs WHERE file = ?", (f,))
+            rows = [_row(item) for item in items]
+            self._insert(c, rows, meta)
+            c.executemany(
+                "INSERT INTO refs_fts (rowid, text, normalized, snippet) VALUES (?, ?, ?, ?)",
+                ((r[0], r[2], r[3], r[8]) for r in rows))
+
+    def _insert(self, c: sqlite3.Connection, rows: Iterable[Tuple], meta: Dict[str, str]):
+        c.executemany(
+            f"INSERT INTO refs ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+            rows,
+        )
+        c.execute("DELETE FROM meta")
+        c.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta.items())
+
+    # ---------- lecture ----------
+    def meta(self) -> Dict[str, str]:
+        return dict(self._conn().execute("SELECT key, value FROM meta").fetchall())
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM refs").fetchone()[0]
+
+    def get(self, item_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(_ITEM_FIELDS)} FROM refs WHERE id = ?", (item_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def max_id(self) -> int:
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM refs").fetchone()[0]
+
+    def items(self) -> Iterator[Dict[str, Any]]:
+        """Toutes les entrées (avec leurs positions start / end), par ID croissant"""
+        cur = self._conn().execute(f"SELECT {', '.join(_ITEM_FIELDS)}, start, end FROM refs ORDER BY id")
+        for row in cur:
+            yield dict(row)
+
+    def query(
+        self,
+        type: Optional[str] = None,
+        normalized: Optional[str] = None,
+        file: Optional[str] = None,
+        folder: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        q: Optional[str] = None,
+        after: int = 0,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Filtres combinés (ET) ; dates ISO incluses ; q : recherche plein
+        texte sur text / normalized / snippet. Renvoie au plus limit entrées
+        d'ID > after."""
+        where, args = ["r.id > ?"], [after]
+        for col, val in (("type", type), ("normalized", normalized), ("file", file), ("folder", folder)):
+            if val is not None:
+                where.append(f"r.{col} = ?")
+                args.append(val)
+        if date_from is not None:
+            where.append("r.date_iso >= ?")
+            args.append(date_from)
+        if date_to is not None:
+            where.append("r.date_iso <= ?")
+            args.append(date_to)
+        if q:
+            where.append("r.id IN (SELECT rowid FROM refs_fts WHERE refs_fts MATCH ?)")
+            args.append(_fts_query(q))
+        sql = (
+            f"SELECT {', '.join('r.' + f for f in _ITEM_FIELDS)} FROM refs r "
+            f"WHERE {' AND '.join(where)} ORDER BY r.id LIMIT ?"
+        )
+        args.append(limit)
+        return [dict(row) for row in self._conn().execute(sql, args)]
@@ -0,0 +1,119 @@
+# test_adversarial.py
+"""
+Entrées adverses de l'annotateur (voir bench.py --adversarial) :
+ - travail quasi linéaire pour les quatre patterns à partie libre bornée
+   (tentatives proportionnelles à la taille, correspondances bornées)
+ - budget de temps : résultat partiel = début exact d'une analyse complète
+ - bornes FREE_MAX : mêmes correspondances que les patterns non bornés sur
+   le corpus ../data
+ - mode "text" : balise en ligne non fermée
+Usage :
+    python -m pytest -q test_adversarial.py
+"""
+
+import re
+import time
+from pathlib import Path
+
+import pytest
+
+from annotator import FREE_MAX, PATTERNS, annotate_html
+from bench import ADVERSARIAL, _adversarial_doc
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+# entrées des patterns dont la partie libre est bornée par FREE_MAX
+BOUNDED = ("loi_sur", "arrete_ministre", "instruction_ministere", "norme")
+SIZE = 16 * 1024
+SCALE = 4
+# longueur des parties fixes d'une référence (type, « du », date…)
+FIXED_MAX = 100
+# fin qui complète chacune des quatre références
+CLOSING = " du 21 septembre 1977, "
+
+
+def _corpus():
+    files = sorted(DATA_DIR.rglob("*.html"))
+    if not files:
+        pytest.skip(f"corpus absent : {DATA_DIR}")
+    return [f.read_text(encoding="utf-8", errors="ignore") for f in files]
+
+
+@pytest.mark.parametrize("name", BOUNDED)
+def test_near_linear(name):
+    # travail compté (compteurs de stats), pas chronométré : stable sur une
+    # machine chargée
+    unit = ADVERSARIAL[name]
+    small, large = {}, {}
+    annotate_html(_adversarial_doc(unit, SIZE), stats=small)
+    annotate_html(_adversarial_doc(unit, SIZE * SCALE), stats=large)
+    for key in ("trigger_hits", "match_attempts"):
+        assert large[key] <= 1.01 * SCALE * small[key], (name, key, small[key], large[key])
+
+
+@pytest.mark.parametrize("name", BOUNDED)
+def test_bounded_spans(name):
+    # La fin du document complète une référence : non bornée, chaque
+    # tentative la chercherait jusque-là (travail quadratique) ; bornée, elle
+    # s'arrête à FREE_MAX caractères (plus les parties fixes).
+    unit = ADVERSARIAL[name]
+    doc = "<p>" + unit * (SIZE // len(unit)) + CLOSING + "</p>"
+    for i, reg in _bounded_patterns():
+        for m in reg.finditer(doc):
+            assert m.end() - m.start() <= FREE_MAX + FIXED_MAX, (name, i, m.span())
+
+
+@pytest.mark.parametrize("name", sorted(ADVERSARIAL))
+def test_budget_partial_is_prefix(name):
+    doc = _adversarial_doc(ADVERSARIAL[name], SIZE * SCALE)
+    _, full = annotate_html(doc)
+    stats = {}
+    _, partial = annotate_html(doc, stats=stats, budget=1e-9)
+    assert stats["partial"]
+    assert partial == full[:len(partial)]
+    assert partial == [r for r in full if r["start"] < stats["cutoff"]]
+
+
+def test_budget_partial_is_prefix_corpus():
+    doc = "\n".join(_corpus()[:20])
+    _, full = annotate_html(doc)
+    t0 = time.perf_counter()
+    annotate_html(doc)
+    elapsed = time.perf_counter() - t0
+    # budgets de ε à environ la moitié du temps d'une analyse complète
+    for budget in (1e-9, elapsed / 8, elapsed / 2):
+        stats = {}
+        _, partial = annotate_html(doc, stats=stats, budget=budget)
+        if not stats.get("partial"):
+            continue
+        assert partial == full[:len(partial)]
+        assert partial == [r for r in full if r["start"] < stats["cutoff"]]
+
+
+def _bounded_patterns():
+    return [(i, reg) for i, (_, reg, _) in enumerate(PATTERNS) if f"{{1,{FREE_MAX}}}" in reg.pattern]
+
+
+def _unbounded(reg: re.Pattern) -> re.Pattern:
+    bound = f"{{1,{FREE_MAX}}}"
+    return re.compile(reg.pattern.replace(bound, "+"), reg.flags)
+
+
+def test_free_max_keeps_corpus_matches():
+    bounded = _bounded_patterns()
+    assert len(bounded) == len(BOUNDED)
+    for text in _corpus():
+        for i, reg in bounded:
+            got = [m.span() for m in reg.finditer(text)]
+            assert got == [m.span() for m in _unbounded(reg).finditer(text)], i
+
+
+@pytest.mark.parametrize("html", [
+    "<p>x <b foo </p><div>décret du 1er mars 2010 > y</div>",
+    "<p>x <span title=\"a </p><div>décret du 1er mars 2010 \" > y</div>",
+])
+def test_text_mode_unclosed_inline_tag(html):
+    # une balise en ligne non fermée s'arrête à la fin de son bloc
+    _, raw = annotate_html(html, mode="raw")
+    _, text = annotate_html(html, mode="text")
+    assert [r["text"] for r in raw] == ["décret du 1er mars 2010"]
+    assert [(r["start"], r["end"]) for r in text] == [(r["start"], r["end"]) for r in raw]
@@ -0,0 +1,34 @@
+# test_compact.py
+"""
+Index compact : extraits relus dans les fichiers sources.
+Usage :
+    python -m pytest -q test_compact.py
+"""
+
+from pathlib import Path
+
+from annotator import annotate_html
+from compact import CompactIndex
+from pipeline import index_entries
+
+
+def _index(path: Path):
+    raw = path.read_text(encoding="utf-8")
+    _, refs = annotate_html(raw)
+    entries = index_entries(raw, refs, str(path))
+    for item_id, e in enumerate(entries, 1):
+        e["id"] = item_id
+    return CompactIndex(entries), entries
+
+
+def test_snippet_follows_rewritten_source(tmp_path):
+    src = tmp_path / "a.html"
+    src.write_text("<p>Vu le décret du 1er mars 2010 relatif à X.</p>", encoding="utf-8")
+    items, entries = _index(src)
+    assert [items.get(e["id"])["snippet"] for e in entries] == [e["snippet"] for e in entries]
+
+    # fichier réécrit puis réindexé : les extraits suivent le nouveau contenu
+    src.write_text("<p>Vu la loi du 2 avril 2011 et le décret du 1er mars 2010.</p>", encoding="utf-8")
+    items, entries = _index(src)
+    assert len(entries) == 2
+    assert [items.get(e["id"])["snippet"] for e in entries] == [e["snippet"] for e in entries]
@@ -0,0 +1,41 @@
+# test_refsjson.py
+"""
+Fichiers <document>_refs.json : les deux formats (--refs-format) se
+relisent avec load_refs() en références identiques.
+Usage :
+    python -m pytest -q test_refsjson.py
+"""
+
+import json
+import zipfile
+
+import pytest
+
+from annotator import annotate_html
+from batch import create_zip
+from refsjson import REFS_FORMATS, dump_refs, load_refs
+
+HTML = ("<p>Vu le décret n° 77-1133 du 21 septembre 1977 et la loi n° 2020-105 "
+        "du 10 janvier 2020 ; vu l'arrêté du 2 février 1998.</p>")
+
+
+@pytest.mark.parametrize("fmt", REFS_FORMATS)
+def test_zip_refs_round_trip(tmp_path, fmt):
+    src = tmp_path / "docs"
+    src.mkdir()
+    (src / "a.html").write_text(HTML, encoding="utf-8")
+    out = tmp_path / "out.zip"
+    create_zip(src, out, refs_format=fmt)
+    with zipfile.ZipFile(out) as z:
+        text = z.read("a_refs.json").decode("utf-8")
+    _, refs = annotate_html(HTML)
+    assert refs
+    assert load_refs(text) == refs
+
+
+def test_json_format_matches_json_dumps():
+    _, refs = annotate_html(HTML)
+    # caractères à échapper et valeur nulle
+    refs.append(dict(refs[0], text="\"\\\né\t", normalized=None))
+    assert dump_refs(refs, "json") == json.dumps(refs, ensure_ascii=False, indent=2)
+    assert load_refs(dump_refs(refs, "compact")) == refs
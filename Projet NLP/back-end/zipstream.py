@@ -0,0 +1,305 @@
+# zipstream.py
+"""
+Archives ZIP au fil de l'eau, en écriture comme en lecture.
+Exporte :
+ - iter_zip(entries, stats=None) -> itérateur de morceaux d'octets de l'archive
+ - ZipWriter : même écriture, entrée par entrée (add() / close() -> octets)
+ - ZipReader : lecture d'une archive reçue par morceaux (feed() -> entrées
+   complètes), sans fichier ni répertoire central
+ - html_entry(name) -> entrée HTML à traiter ? (ni __MACOSX, ni "._*")
+
+Chaque entrée (nom, contenu) est compressée puis émise aussitôt : seule
+l'entrée courante est en mémoire, sans fichier ni dossier intermédiaire.
+zipfile sait écrire sur un flux non repositionnable (tailles et CRC dans un
+descripteur après les données).
+
+En lecture, les en-têtes locaux qui précèdent chaque entrée suffisent : une
+entrée est rendue dès que ses données sont reçues, la mémoire est bornée par
+la plus grosse entrée (max_size la plafonne, contre les bombes de
+décompression).
+"""
+
+import struct
+import zipfile
+import zlib
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+
+class _Sink:
+    """Flux en écriture seule : tell() mais pas de seek(), ce qui met
+    zipfile en mode flux"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipWriter:
+    """
+    add(nom, contenu) renvoie les octets de l'entrée, close() ceux du
+    répertoire central. stats : dict optionnel où sont cumulés
+    compress_seconds (compression et écriture des entrées) et bytes (taille
+    de l'archive).
+    """
+
+    def __init__(self, compression: int = zipfile.ZIP_DEFLATED,
+                 stats: Optional[Dict[str, float]] = None):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression)
+        self.stats = stats
+        if stats is not None:
+            stats.setdefault("compress_seconds", 0.0)
+            stats.setdefault("bytes", 0)
+
+    def add(self, name: str, content: Union[str, bytes]) -> bytes:
+        if self.stats is not None:
+            t0 = perf_counter()
+            self._zip.writestr(name, content)
+            self.stats["compress_seconds"] += perf_counter() - t0
+            self.stats["bytes"] = self._sink.tell()
+        else:
+            self._zip.writestr(name, content)
+        return self._sink.take()
+
+    def close(self) -> bytes:
+        self._zip.close()
+        if self.stats is not None:
+            self.stats["bytes"] = self._sink.tell()
+        return self._sink.take()
+
+
+def iter_zip(
+    entries: Iterable[Tuple[str, Union[str, bytes]]],
+    compression: int = zipfile.ZIP_DEFLATED,
+    stats: Optional[Dict[str, float]] = None,
+) -> Iterator[bytes]:
+    """stats : voir ZipWriter"""
+    writer = ZipWriter(compression, stats)
+    for name, content in entries:
+        data = writer.add(name, content)
+        if data:
+            yield data
+    # répertoire central, écrit à la fermeture
+    data = writer.close()
+    if data:
+        yield data
+
+
+def html_entry(name: str) -> bool:
+    """Règle commune aux archives et aux dossiers (pipeline.html_files) :
+    extension ".html" en minuscules, comme rglob("*.html") ; ressources
+    macOS ignorées"""
+    base = name.rsplit("/", 1)[-1]
+    return name.endswith(".html") and "__MACOSX" not in name and not base.startswith("._")
+
+
+# ---------- lecture ----------
+_LOCAL = b"PK\x03\x04"
+_DESCRIPTOR = b"PK\x07\x08"
+_CENTRAL = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")
+_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")  # 30 octets
+_ZIP64_EXTRA, _UNICODE_PATH_EXTRA = 0x0001, 0x7075
+_FLAG_ENCRYPTED, _FLAG_DESCRIPTOR, _FLAG_UTF8 = 0x1, 0x8, 0x800
+
+
+def _extra_field(extra: bytes, tag: int) -> Optional[bytes]:
+    pos = 0
+    while pos + 4 <= len(extra):
+        t, size = struct.unpack_from("<HH", extra, pos)
+        if t == tag:
+            return extra[pos + 4:pos + 4 + size]
+        pos += 4 + size
+    return None
+
+
+def _entry_name(raw: bytes, flags: int, extra: bytes) -> str:
+    """Nom UTF-8 si l'indicateur est posé ; sinon champ « Unicode Path »
+    d'Info-ZIP s'il correspond, puis UTF-8 s'il est valide (archiveurs qui
+    n'indiquent pas l'encodage), enfin cp437 comme le veut la norme"""
+    if flags & _FLAG_UTF8:
+        return raw.decode("utf-8", errors="replace")
+    unicode_path = _extra_field(extra, _UNICODE_PATH_EXTRA)
+    if unicode_path and len(unicode_path) > 5 and struct.unpack_from("<I", unicode_path, 1)[0] == zlib.crc32(raw):
+        return unicode_path[5:].decode("utf-8", errors="replace")
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("cp437")
+
+
+def _zip64_sizes(extra: bytes, csize: int, usize: int) -> Tuple[int, int, bool]:
+    """(taille compressée, taille, zip64 ?) : champ extra 0x0001 si les
+    tailles de l'en-tête valent 0xFFFFFFFF"""
+    values = _extra_field(extra, _ZIP64_EXTRA)
+    if values is None:
+        return csize, usize, False
+    k = 0
+    if usize == 0xFFFFFFFF:
+        usize, k = struct.unpack_from("<Q", values, k)[0], k + 8
+    if csize == 0xFFFFFFFF:
+        csize = struct.unpack_from("<Q", values, k)[0]
+    return csize, usize, True
+
+
+class ZipReader:
+    """
+    Archive lue dans l'ordre, sans se repositionner : feed(octets) renvoie
+    les (nom, contenu) des entrées terminées, close() vérifie que l'archive
+    n'est pas tronquée. Entrées stockées ou compressées (deflate), y compris
+    avec descripteur de données (tailles inconnues dans l'en-tête) si elles
+    sont compressées ; CRC vérifié. ValueError si l'archive est invalide ou
+    si une entrée dépasse max_size octets une fois décompressée.
+    Les répertoires (noms en "/") sont rendus comme les fichiers.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self.max_size = max_size
+        self._buf = bytearray()
+        self._entry: Optional[Dict] = None
+        self._done = False
+
+    def feed(self, data: bytes) -> List[Tuple[str, bytes]]:
+        self._buf += data
+        out: List[Tuple[str, bytes]] = []
+        while not self._done:
+            if self._entry is None:
+                if not self._header():
+                    break
+            elif self._entry["state"] == "data":
+                if not self._data():
+                    break
+            elif not self._descriptor():
+                break
+            if self._entry is not None and self._entry["state"] == "ready":
+                out.append((self._entry["name"], b"".join(self._entry["out"])))
+                self._entry = None
+        return out
+
+    def close(self):
+        if not self._done and (self._entry is not None or self._buf):
+            raise ValueError("Archive ZIP tronquée")
+
+    # -- étapes --
+    def _header(self) -> bool:
+        if len(self._buf) < 4:
+            return False
+        sig = bytes(self._buf[:4])
+        if sig in _CENTRAL:
+            # répertoire central : plus d'entrée, la suite est ignorée
+            self._done = True
+            self._buf = bytearray()
+            return False
+        if sig != _LOCAL:
+            raise ValueError("Archive ZIP invalide (en-tête local attendu)")
+        if len(self._buf) < _LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, csize, usize, nlen, xlen) = _LOCAL_HEADER.unpack_from(self._buf)
+        end = _LOCAL_HEADER.size + nlen + xlen
+        if len(self._buf) < end:
+            return False
+        raw_name = bytes(self._buf[_LOCAL_HEADER.size:_LOCAL_HEADER.size + nlen])
+        extra = bytes(self._buf[_LOCAL_HEADER.size + nlen:end])
+        del self._buf[:end]
+
+        name = _entry_name(raw_name, flags, extra)
+        if flags & _FLAG_ENCRYPTED:
+            raise ValueError(f"Entrée chiffrée non prise en charge : {name}")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ValueError(f"Méthode de compression non prise en charge ({method}) : {name}")
+        csize, usize, zip64 = _zip64_sizes(extra, csize, usize)
+        streamed = bool(flags & _FLAG_DESCRIPTOR)
+        if streamed and method == zipfile.ZIP_STORED:
+            raise ValueError(f"Entrée stockée de taille inconnue non prise en charge : {name}")
+        if not streamed and self.max_size is not None and usize > self.max_size:
+            raise ValueError(f"Entrée trop volumineuse ({usize} octets) : {name}")
+        self._entry = {
+            "name": name, "state": "data", "crc": crc, "zip64": zip64,
+            "streamed": streamed, "remaining": csize, "size": 0, "out": [],
+            "inflate": zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+            "check": 0,
+        }
+        return True
+
+    def _emit(self, data: bytes):
+        e = self._entry
+        e["size"] += len(data)
+        if self.max_size is not None and e["size"] > self.max_size:
+            raise ValueError(f"Entrée trop volumineuse (plus de {self.max_size} octets) : {e['name']}")
+        e["check"] = zlib.crc32(data, e["check"])
+        e["out"].append(data)
+
+    def _data(self) -> bool:
+        e = self._entry
+        if e["streamed"]:
+            # fin des données : fin du flux deflate
+            inflate = e["inflate"]
+            data = bytes(self._buf)
+            self._buf = bytearray()
+            self._inflate(inflate, data)
+            if not inflate.eof:
+                return False
+            self._buf = bytearray(inflate.unused_data)
+            e["state"] = "descriptor"
+            return True
+        take = min(e["remaining"], len(self._buf))
+        data = bytes(self._buf[:take])
+        del self._buf[:take]
+        e["remaining"] -= take
+        if e["inflate"] is not None:
+            self._inflate(e["inflate"], data)
+        elif data:
+            self._emit(data)
+        if e["remaining"]:
+            return False
+        self._finish(e["crc"])
+        return True
+
+    def _inflate(self, inflate, data: bytes):
+        # par tranches bornées : une bombe de décompression est arrêtée tôt
+        limit = 1 << 20
+        while data:
+            try:
+                chunk = inflate.decompress(data, limit)
+            except zlib.error:
+                raise ValueError(f"Données compressées invalides : {self._entry['name']}")
+            if chunk:
+                self._emit(chunk)
+            data = inflate.unconsumed_tail
+            if inflate.eof:
+                break
+
+    def _descriptor(self) -> bool:
+        e = self._entry
+        size = 4 + (16 if e["zip64"] else 8)
+        has_sig = len(self._buf) >= 4 and bytes(self._buf[:4]) == _DESCRIPTOR
+        if len(self._buf) < size + (4 if has_sig else 0) or len(self._buf) < 4:
+            return False
+        start = 4 if has_sig else 0
+        crc = struct.unpack_from("<I", self._buf, start)[0]
+        del self._buf[:start + size]
+        self._finish(crc)
+        return True
+
+    def _finish(self, crc: int):
+        e = self._entry
+        if e["check"] != crc:
+            raise ValueError(f"CRC incorrect : {e['name']}")
+        e["state"] = "ready"